@@ -0,0 +1,44 @@
+"""Benchmarks for the simulators in this repository.
+
+Run them from the repository root, e.g. ``python -m benchmarks.memory``.
+"""
+
+import re
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def load_messagingapp():
+    """Registers the app_logic package bundled in messagingapp.py.
+
+    messagingapp.py is the app_logic project pasted into one file, one
+    "# File: app_logic/..." section per module. Each section is executed as
+    that module, padded so tracebacks keep the line numbers of the file.
+    """
+    if "app_logic" in sys.modules:
+        return sys.modules["app_logic"]
+    path = ROOT / "messagingapp.py"
+    text = path.read_text()
+    package = types.ModuleType("app_logic")
+    package.__path__ = []
+    sys.modules["app_logic"] = package
+    headers = list(re.finditer(r"^# File: (\S+)\n", text, flags=re.M))
+    for header, after in zip(headers, headers[1:] + [None]):
+        name = header.group(1)
+        if not name.startswith("app_logic/"):
+            continue
+        end = after.start() if after else len(text)
+        padding = "\n" * text.count("\n", 0, header.end())
+        module_name = name[: -len(".py")].replace("/", ".")
+        module = types.ModuleType(module_name)
+        module.__file__ = str(path)
+        sys.modules[module_name] = module
+        setattr(package, module_name.split(".")[-1], module)
+        code = compile(padding + text[header.end() : end], str(path), "exec")
+        exec(code, module.__dict__)
+    return package
@@ -0,0 +1,116 @@
+"""Resident bytes per entity, slotted classes vs the same classes with a __dict__.
+
+    python -m benchmarks.memory [--count N] [--json PATH]
+
+Every entity is built from arguments created beforehand, so the figures cover
+the object and the containers it owns, not its names. The "dict" column uses a
+copy of each class without __slots__ (and plain dict Directory.children).
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from datetime import datetime
+
+from benchmarks import load_messagingapp
+
+import confscheduling
+import filehostingsystem
+import pethotel
+import studentscheduling
+
+
+def unslotted(cls):
+    """same class body, instances get a __dict__ again"""
+    skip = set(cls.__slots__) | {"__slots__", "__dict__", "__weakref__"}
+    body = {k: v for k, v in cls.__dict__.items() if k not in skip}
+    if cls is filehostingsystem.Directory:
+        body["tiny_size"] = 0
+    return type(cls.__name__, cls.__bases__, body)
+
+
+def bytes_per_entity(build, args):
+    """traced allocation growth per build(*a), for a in args"""
+    objects = [None] * len(args)
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for i, a in enumerate(args):
+        objects[i] = build(*a)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return size / len(args)
+
+
+def directory_with(files):
+    def build(name, *children):
+        directory = files(name)
+        for child in children:
+            directory.add(child)
+        return directory
+
+    return build
+
+
+def entities(n):
+    """(label, class, factory for a class, argument tuples)"""
+    fhs, conf, hotel = filehostingsystem, confscheduling, pethotel
+    school = studentscheduling
+    users = load_messagingapp()
+    now = datetime(2024, 1, 1)
+    names = [f"entity{i}" for i in range(n)]
+    files = [fhs.File(name, i, now, None) for i, name in enumerate(names)]
+    customer = hotel.Customer("customer", 0)
+
+    def plain(cls):
+        return cls, lambda c: c
+
+    numbered = list(enumerate(names))
+    yield "File", *plain(fhs.File), [(name, i, now, None) for i, name in numbered]
+    yield "Directory", *plain(fhs.Directory), [(name,) for name in names]
+    yield (
+        "Directory (4 files)",
+        fhs.Directory,
+        directory_with,
+        [(name, *files[i : i + 4]) for i, name in numbered[: n - 4]],
+    )
+    yield "User", *plain(users.app_impl.User), [(name, i) for i, name in numbered]
+    yield "Talk", *plain(conf.Talk), [(name, 50, i, i + 1) for i, name in numbered]
+    yield "Attendee", *plain(conf.Attendee), [(name,) for name in names]
+    yield "Room (conference)", *plain(conf.Room), [(name, 100) for name in names]
+    yield "Room (pet hotel)", *plain(hotel.Room), [(name, name, 4) for name in names]
+    yield "Customer", *plain(hotel.Customer), [(name, i) for i, name in numbered]
+    yield "Pet", *plain(hotel.Pet), [(name, "cat", customer) for name in names]
+    yield "TimeSlot", *plain(school.TimeSlot), [(i % 7, i % 24, 1) for i in range(n)]
+    yield "Course", *plain(school.Course), [(name, name, 3, 30) for name in names]
+    yield "Classroom", *plain(school.Classroom), [(name, 30) for name in names]
+    yield "Student", *plain(school.Student), [(name, name) for name in names]
+
+
+def run(n):
+    rows = []
+    for label, cls, factory, args in entities(n):
+        before = bytes_per_entity(factory(unslotted(cls)), args)
+        after = bytes_per_entity(factory(cls), args)
+        rows.append({"entity": label, "dict": round(before), "slots": round(after)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--json", help="also write the rows to this file")
+    options = parser.parse_args()
+    rows = run(options.count)
+    print(f"{'entity':<20} {'dict':>8} {'slots':>8} {'saved':>6}")
+    for row in rows:
+        saved = 1 - row["slots"] / row["dict"]
+        print(f"{row['entity']:<20} {row['dict']:>8} {row['slots']:>8} {saved:>6.0%}")
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump({"count": options.count, "bytes_per_entity": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Latency percentiles and throughput of the hot operations of every simulator.
+
+    python -m benchmarks.suite [--scales 1000 100000] [--modules ...]
+        [--seed 0] [--queries N] [--json PATH] [--compare OLD.json]
+
+Every module is driven by its seeded workload from benchmarks.workloads at each
+scale point. Calls that raise (a full talk, an expired file...) are timed and
+counted as errors, they are part of the workload.
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import ROOT, load_messagingapp, workloads
+
+import confscheduling
+import filehostingsystem
+import pethotel
+import studentscheduling
+
+START = datetime(2024, 1, 1)
+SECOND = timedelta(seconds=1)
+
+
+class Recorder:
+    """latency samples and error counts per operation"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def call(self, op: str, fn, *args):
+        start = time.perf_counter_ns()
+        try:
+            result = fn(*args)
+        except Exception:
+            result = None
+            self.errors[op] = self.errors.get(op, 0) + 1
+        self.samples.setdefault(op, []).append(time.perf_counter_ns() - start)
+        return result
+
+    def summary(self):
+        rows = []
+        for op, samples in self.samples.items():
+            samples.sort()
+            total = sum(samples)
+
+            def percentile(q):
+                return samples[min(len(samples) - 1, int(q * len(samples)))] / 1000
+
+            rows.append(
+                {
+                    "op": op,
+                    "calls": len(samples),
+                    "errors": self.errors.get(op, 0),
+                    "p50_us": percentile(0.5),
+                    "p90_us": percentile(0.9),
+                    "p99_us": percentile(0.99),
+                    "max_us": samples[-1] / 1000,
+                    "ops_per_s": len(samples) / (total / 1e9) if total else None,
+                }
+            )
+        return rows
+
+
+def bench_filehostingsystem(rec: Recorder, seed: int, n: int, queries: int):
+    fhs = filehostingsystem
+    w = workloads.file_tree(seed, n)
+    server = fhs.Server("bench", retention=fhs.RetentionPolicy(keep_last=1000))
+    nodes = {"": server.root}
+    for path in w["dirs"]:
+        parent, _, name = path.rpartition("/")
+        nodes[path] = fhs.Directory(name)
+        nodes[parent].add(nodes[path])
+    rng = random.Random(seed)
+    t = START
+    for path, size, ttl in w["uploads"]:
+        t += SECOND
+        expires = t + timedelta(seconds=ttl) if ttl else None
+        rec.call("FILE_UPLOAD_AT", server.FILE_UPLOAD_AT, t, path, size, expires)
+    permanent = w["permanent"] or [w["uploads"][0][0]]
+    for path in rng.choices(permanent, k=queries):
+        t += SECOND
+        rec.call("FILE_GET_AT", server.FILE_GET_AT, t, path)
+    for i, path in enumerate(rng.choices(permanent, k=queries)):
+        t += SECOND
+        rec.call("FILE_COPY_AT", server.FILE_COPY_AT, t, path, f"{path}.copy{i}")
+    for _ in range(max(1, queries // 10)):
+        t += SECOND
+        prefix = f"f{rng.randrange(10, max(11, n))}"
+        rec.call("FILE_SEARCH_AT", server.FILE_SEARCH_AT, t, prefix)
+    for path in rng.choices(w["dirs"] or [""], k=queries):
+        t += SECOND
+        rec.call("DIR_USAGE_AT", server.DIR_USAGE_AT, t, path)
+    for _ in range(max(1, queries // 10)):
+        t += SECOND
+        rec.call("DIR_TOP_AT", server.DIR_TOP_AT, t, "", 10)
+    for _ in range(max(3, queries // 1000)):  # each one re-indexes the whole tree
+        rec.call("ROLLBACK", server.ROLLBACK, t - SECOND * rng.randrange(1, 900))
+
+
+def bench_messagingapp(rec: Recorder, seed: int, n: int, queries: int):
+    w = workloads.social_graph(seed, n)
+    app = load_messagingapp().app_impl.AppImpl()
+    rng = random.Random(seed)
+    for user in w["users"]:
+        rec.call("create_user", app.create_user, user)
+    for blocker, blockee in w["blocks"]:
+        rec.call("block_user", app.block_user, blocker, blockee)
+    for sender, receiver, text in w["messages"]:
+        rec.call("send_message", app.send_message, sender, receiver, text)
+    for user in rng.choices(w["users"], k=queries):
+        rec.call("get_messages", app.get_messages, user)
+    for user in rng.choices(w["users"], k=queries):
+        rec.call("get_latest_messages", app.get_latest_messages, user)
+    for user in rng.sample(w["users"], max(1, min(n, queries) // 10)):
+        rec.call("delete_user", app.delete_user, user)
+
+
+def bench_confscheduling(rec: Recorder, seed: int, n: int, queries: int):
+    conf_module = confscheduling
+    w = workloads.conference_program(seed, n)
+    attendees = [conf_module.Attendee(f"a{i}") for i in range(w["attendees"])]
+    talks = [conf_module.Talk(*talk) for talk in w["talks"]]
+    rooms = [conf_module.Room(*room) for room in w["rooms"]]
+    conf = conf_module.Conference("bench")
+    rng = random.Random(seed)
+    for attendee in attendees:
+        rec.call("add_attendee", conf.add_attendee, attendee)
+    for talk in talks:
+        rec.call("add_talk", conf.add_talk, talk)
+    for room in rooms:
+        rec.call("add_room", conf.add_room, room)
+    rec.call("assign_all_rooms", conf.assign_all_rooms)
+    for a, t in w["registrations"]:
+        rec.call("register_for_talk", conf.register_for_talk, attendees[a], talks[t])
+    for attendee in rng.choices(attendees, k=queries):
+        rec.call("get_schedule", conf.get_schedule, attendee)
+    for attendee, talk in zip(
+        rng.choices(attendees, k=queries), rng.choices(talks, k=queries)
+    ):
+        rec.call("is_registered", conf.is_registered, attendee, talk)
+
+    batch = conf_module.Conference("batch")
+    batch.attendees = [conf_module.Attendee(f"a{i}") for i in range(w["attendees"])]
+    batch.talks = [conf_module.Talk(*talk) for talk in w["talks"]]
+    pairs = [(batch.attendees[a], batch.talks[t]) for a, t in w["registrations"]]
+    rec.call("register_batch", batch.register_batch, pairs)
+
+
+def bench_pethotel(rec: Recorder, seed: int, n: int, queries: int):
+    w = workloads.checkin_waves(seed, n)
+    hotel = pethotel.PetHotel()
+    customers = [pethotel.Customer(f"c{i}", i) for i in range(w["customers"])]
+    pets = [pethotel.Pet(name, species, customers[c]) for name, species, c in w["pets"]]
+    rng = random.Random(seed)
+    for customer in customers:
+        hotel.register_customer(customer)
+    for room in w["rooms"]:
+        rec.call("add_room", hotel.add_room, pethotel.Room(*room))
+    for pet in pets:
+        rec.call("add_pet", hotel.add_pet, pet)
+    for wave in w["waves"]:
+        arriving = [pets[i] for i in wave]
+        rec.call("check_in_many", hotel.check_in_many, arriving)
+        leaving = rng.sample(arriving, len(arriving) * 4 // 5)
+        rec.call("check_out_many", hotel.check_out_many, leaving)
+    away = [pet for pet in pets if not pet.checked_in]
+    for pet in rng.sample(away, min(queries, len(away))):
+        rec.call("check_in", hotel.check_in, pet)
+        rec.call("auto_assign", hotel.auto_assign, pet)
+        rec.call("check_out", hotel.check_out, pet)
+
+    def count_pets(species):
+        return sum(1 for _ in hotel.list_pets(species, checked_in=True))
+
+    for species in rng.choices(workloads.SPECIES, k=max(1, queries // 10)):
+        rec.call("list_pets", count_pets, species)
+
+
+def bench_studentscheduling(rec: Recorder, seed: int, n: int, queries: int):
+    school = studentscheduling
+    w = workloads.registrar_import(seed, n)
+    uni = school.University()
+    rng = random.Random(seed)
+    for sid in w["students"]:
+        rec.call("register_student", uni.register_student, school.Student(sid, sid))
+    for course in w["courses"]:
+        rec.call("add_course", uni.add_course, school.Course(*course))
+    for room in w["classrooms"]:
+        rec.call("add_classroom", uni.add_classroom, school.Classroom(*room))
+    for booking in w["bookings"]:
+        rec.call("schedule_course", uni.schedule_course, *booking)
+    for sid, cid in w["enrollments"]:
+        rec.call("enroll_student_in_course", uni.enroll_student_in_course, sid, cid)
+    for sid in rng.choices(w["students"], k=queries):
+        rec.call(
+            "check_student_schedule_conflicts",
+            uni.check_student_schedule_conflicts,
+            sid,
+        )
+    for course, room in zip(
+        rng.choices(w["courses"], k=queries), rng.choices(w["classrooms"], k=queries)
+    ):
+        rec.call("find_free_slot", uni.find_free_slot, course[0], room[0])
+
+
+BENCHMARKS = {
+    "filehostingsystem": bench_filehostingsystem,
+    "messagingapp": bench_messagingapp,
+    "confscheduling": bench_confscheduling,
+    "pethotel": bench_pethotel,
+    "studentscheduling": bench_studentscheduling,
+}
+
+
+def run(modules, scales, seed, queries=None):
+    results = []
+    for n in scales:
+        for module in modules:
+            rec = Recorder()
+            start = time.perf_counter()
+            BENCHMARKS[module](rec, seed, n, queries or min(n, 10000))
+            elapsed = time.perf_counter() - start
+            for row in rec.summary():
+                results.append({"module": module, "scale": n, **row})
+            print(f"{module} n={n}: {elapsed:.1f}s", file=sys.stderr)
+    return results
+
+
+def metadata(seed, scales):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "seed": seed,
+        "scales": scales,
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def print_table(results):
+    print(
+        f"{'module':<18} {'n':>8} {'op':<34} {'calls':>8} {'errors':>7} "
+        f"{'p50 us':>9} {'p99 us':>10} {'ops/s':>11}"
+    )
+    for r in results:
+        rate = f"{r['ops_per_s']:.0f}" if r["ops_per_s"] else "-"
+        print(
+            f"{r['module']:<18} {r['scale']:>8} {r['op']:<34} {r['calls']:>8} "
+            f"{r['errors']:>7} {r['p50_us']:>9.1f} {r['p99_us']:>10.1f} {rate:>11}"
+        )
+
+
+def compare(old_results, results, threshold):
+    """prints ops whose p50 grew by more than threshold since the old run"""
+    old = {(r["module"], r["scale"], r["op"]): r for r in old_results}
+    regressions = 0
+    for r in results:
+        before = old.get((r["module"], r["scale"], r["op"]))
+        if before is None or not before["p50_us"]:
+            continue
+        ratio = r["p50_us"] / before["p50_us"]
+        if ratio > 1 + threshold:
+            regressions += 1
+            print(
+                f"slower: {r['module']} n={r['scale']} {r['op']} p50 "
+                f"{before['p50_us']:.1f} -> {r['p50_us']:.1f} us ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument(
+        "--modules", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS)
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--queries", type=int, help="calls per query op, default min(n, 10000)"
+    )
+    parser.add_argument("--json", help="write metadata and results to this file")
+    parser.add_argument("--compare", help="results of an earlier run, JSON")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed p50 growth"
+    )
+    options = parser.parse_args()
+    results = run(options.modules, options.scales, options.seed, options.queries)
+    print_table(results)
+    if options.json:
+        with open(options.json, "w") as f:
+            meta = metadata(options.seed, options.scales)
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            old = json.load(f)["results"]
+        if compare(old, results, options.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Seeded synthetic workloads, plain data so every module can be fed the same run.
+
+Each generator takes (seed, n), n being the headline entity count, and returns a
+dict of lists. The same seed and n always give the same workload.
+"""
+
+import random
+
+SPECIES = ("cat", "dog", "rabbit", "parrot", "hamster")
+
+
+def file_tree(seed: int, n: int, max_depth: int = 24):
+    """n files spread over a deep, skewed directory tree, ~30% with a TTL
+
+    dirs: paths, parents before children. uploads: (path, size, ttl seconds or
+    None). permanent: paths of the files without a TTL.
+    """
+    rng = random.Random(seed)
+    dirs = [()]
+    for i in range(max(1, n // 32)):
+        if rng.random() < 0.3:
+            parent = dirs[-1]  # keeps growing the newest branch, so trees get deep
+        else:
+            parent = rng.choice(dirs)
+        if len(parent) >= max_depth:
+            parent = ()
+        dirs.append(parent + (f"d{i}",))
+    uploads, permanent = [], []
+    for i in range(n):
+        path = "/".join(rng.choice(dirs) + (f"f{i}",))
+        size = int(rng.lognormvariate(8, 2)) + 1
+        ttl = rng.randint(60, 86400) if rng.random() < 0.3 else None
+        uploads.append((path, size, ttl))
+        if ttl is None:
+            permanent.append(path)
+    return {
+        "dirs": ["/".join(d) for d in dirs[1:]],
+        "uploads": uploads,
+        "permanent": permanent,
+    }
+
+
+def social_graph(seed: int, n: int, messages_per_user: int = 4):
+    """n users with Zipf-like popularity, block edges and repeated texts
+
+    users: names. blocks: (blocker, blockee). messages: (sender, receiver,
+    text), most texts come from a small pool of common ones.
+    """
+    rng = random.Random(seed)
+    users = [f"u{i}" for i in range(n)]
+    weights, total = [], 0.0
+    for i in range(n):
+        total += 1 / (i + 1) ** 0.8
+        weights.append(total)
+    common = [f"common message {i}" for i in range(64)]
+    blocks = [
+        (rng.choice(users), r)
+        for r in rng.choices(users, cum_weights=weights, k=n // 10)
+    ]
+    receivers = rng.choices(users, cum_weights=weights, k=n * messages_per_user)
+    messages = []
+    for i, receiver in enumerate(receivers):
+        text = rng.choice(common) if rng.random() < 0.7 else f"message {i}"
+        messages.append((rng.choice(users), receiver, text))
+    return {"users": users, "blocks": blocks, "messages": messages}
+
+
+def conference_program(seed: int, n: int, talks_per_attendee: int = 8):
+    """n attendees, n // 10 talks over five days, one room per ~8 talks
+
+    talks: (title, capacity, start, end) in minutes. rooms: (name, capacity).
+    registrations: (attendee index, talk index), some collide or overflow.
+    """
+    rng = random.Random(seed)
+    talks = []
+    for i in range(max(10, n // 10)):
+        start = rng.randrange(0, 5 * 24 * 60, 30)
+        end = start + 30 * rng.randint(1, 3)
+        talks.append((f"t{i}", rng.choice((20, 50, 100, 400)), start, end))
+    rooms = [
+        (f"r{i}", rng.choice((50, 100, 400))) for i in range(max(2, len(talks) // 8))
+    ]
+    registrations = [
+        (a, t)
+        for a in range(n)
+        for t in rng.sample(range(len(talks)), min(talks_per_attendee, len(talks)))
+    ]
+    return {
+        "attendees": n,
+        "talks": talks,
+        "rooms": rooms,
+        "registrations": registrations,
+    }
+
+
+def checkin_waves(seed: int, n: int, waves: int = 10):
+    """n pets of n // 3 customers, n // 3 rooms, checked in and out in waves
+
+    rooms: (id, name, capacity). pets: (name, species, customer index).
+    waves: lists of pet indexes; each wave checks in, then 80% of it leaves.
+    """
+    rng = random.Random(seed)
+    customers = max(1, n // 3)
+    rooms = [(f"r{i}", f"room {i}", rng.randint(1, 6)) for i in range(customers)]
+    pets = [(f"p{i}", rng.choice(SPECIES), rng.randrange(customers)) for i in range(n)]
+    order = list(range(n))
+    rng.shuffle(order)
+    size = max(1, n // waves)
+    return {
+        "customers": customers,
+        "rooms": rooms,
+        "pets": pets,
+        "waves": [order[i : i + size] for i in range(0, n, size)],
+    }
+
+
+def registrar_import(seed: int, n: int, courses_per_student: int = 5):
+    """n students, n // 20 courses in n // 100 classrooms, one or two sessions each
+
+    courses: (id, name, credits, max students). classrooms: (id, capacity).
+    bookings: (course id, room id, day, slot). enrollments: (student id,
+    course id), in import order.
+    """
+    rng = random.Random(seed)
+    students = [f"s{i}" for i in range(n)]
+    courses = [
+        (f"c{i}", f"course {i}", rng.choice((2, 3, 4)), rng.choice((30, 60, 200)))
+        for i in range(max(10, n // 20))
+    ]
+    classrooms = [
+        (f"room{i}", rng.choice((60, 200, 400))) for i in range(max(2, n // 100))
+    ]
+    bookings = []
+    for course_id, *_ in courses:
+        for _ in range(rng.randint(1, 2)):
+            room = rng.choice(classrooms)[0]
+            bookings.append((course_id, room, rng.randrange(5), rng.randrange(8, 18)))
+    enrollments = [
+        (student, courses[c][0])
+        for student in students
+        for c in rng.sample(range(len(courses)), courses_per_student)
+    ]
+    return {
+        "students": students,
+        "courses": courses,
+        "classrooms": classrooms,
+        "bookings": bookings,
+        "enrollments": enrollments,
+    }
@@ -1,24 +1,46 @@
+import bisect
+import heapq
+
+# register_batch statuses
+REGISTERED = 0
+ALREADY_GOING = 1
+TALK_FULL = 2
+COLLIDING = 3
+REFUSALS = {
+    ALREADY_GOING: "Attendee is already going.",
+    TALK_FULL: "The talk is full.",
+    COLLIDING: "Colliding time slots.",
+}
+
+
 class Room:
+    __slots__ = ("name", "capacity", "talks")
+
     def __init__(self, name: str, capacity: int):
         self.name = name
         self.capacity = capacity
-        self.talks = []
+        self.talks = []  # sorted by start_time, never overlapping
 
 
 class Talk:
+    __slots__ = ("title", "capacity", "attendees", "room", "start_time", "end_time")
+
     def __init__(self, title: str, capacity: int, start_time: int, end_time: int):
         self.title = title
         self.capacity = capacity
-        self.attendees = []
+        self.attendees = set()
         self.room = None
         self.start_time = start_time
         self.end_time = end_time
 
 
 class Attendee:
+    __slots__ = ("name", "talks", "schedule")
+
     def __init__(self, name: str):
         self.name = name
-        self.talks = []
+        self.talks = []  # sorted by start_time, never overlapping
+        self.schedule = []  # (start_time, end_time) of talks, same order
 
 
 class Conference:
@@ -38,33 +60,114 @@ class Conference:
             raise Exception("Talk is already there.")
         self.talks.append(talk)
 
-    def register_for_talk(self, attendee: Attendee, talk: Talk):
+    def add_room(self, room: Room):
+        if room in self.rooms:
+            raise Exception("Room is already there.")
+        self.rooms.append(room)
+
+    def _registration_status(self, attendee: Attendee, talk: Talk):
+        """(status, position of talk in attendee.talks when REGISTERED)"""
         if attendee in talk.attendees:
-            raise Exception("Attendee is already going.")
+            return ALREADY_GOING, None
         if len(talk.attendees) >= talk.capacity:
-            raise Exception("The talk is full.")
-        for t in attendee.talks:
-            if not (t.end_time <= talk.start_time or talk.end_time <= t.start_time):
-                raise Exception("Colliding time slots.")
-            # if t.start_time > talk.start_time:
-            #     if t.start_time < talk.end_time:
-            #         raise Exception("Colliding time slots.1")
-            # elif t.start_time < talk.start_time:
-            #     if t.end_time > talk.start_time:
-            #         raise Exception("Colliding time slots.2")
-        talk.attendees.append(attendee)
-        attendee.talks.append(talk)
+            return TALK_FULL, None
+        # intervals are disjoint, so only the neighbours can overlap
+        i = bisect.bisect_right(
+            attendee.schedule, talk.start_time, key=lambda interval: interval[0]
+        )
+        if i > 0 and attendee.schedule[i - 1][1] > talk.start_time:
+            return COLLIDING, None
+        if i < len(attendee.schedule) and attendee.schedule[i][0] < talk.end_time:
+            return COLLIDING, None
+        return REGISTERED, i
+
+    def _register(self, attendee: Attendee, talk: Talk, i: int):
+        talk.attendees.add(attendee)
+        attendee.talks.insert(i, talk)
+        attendee.schedule.insert(i, (talk.start_time, talk.end_time))
+
+    def register_for_talk(self, attendee: Attendee, talk: Talk):
+        status, i = self._registration_status(attendee, talk)
+        if status != REGISTERED:
+            raise Exception(REFUSALS[status])
+        self._register(attendee, talk, i)
+
+    def register_batch(self, pairs: list[tuple[Attendee, Talk]]) -> list[int]:
+        """register_for_talk for every (attendee, talk) in order, without raising
+
+        Returns a status per pair: REGISTERED, or why it was refused. Every
+        pair sees the ones before it, so a repeated pair is ALREADY_GOING.
+        """
+        statuses = []
+        for attendee, talk in pairs:
+            status, i = self._registration_status(attendee, talk)
+            if status == REGISTERED:
+                self._register(attendee, talk, i)
+            statuses.append(status)
+        return statuses
 
     def is_registered(self, attendee: Attendee, talk: Talk):
         if attendee in talk.attendees:
             return True
         return False
 
+    def _free_position(self, room: Room, talk: Talk):
+        """where talk goes in room.talks, None if a booking overlaps it"""
+        i = bisect.bisect_right(room.talks, talk.start_time, key=lambda t: t.start_time)
+        if i > 0 and room.talks[i - 1].end_time > talk.start_time:
+            return None
+        if i < len(room.talks) and room.talks[i].start_time < talk.end_time:
+            return None
+        return i
+
     def assign_room(self, room: Room, talk: Talk):
         if talk.capacity > room.capacity:
             raise Exception("Talk registrations to much.")
-        room.talks.append(talk)
+        i = self._free_position(room, talk)
+        if i is None:
+            raise Exception("Room is already booked.")
+        room.talks.insert(i, talk)
         talk.room = room
 
+    def assign_all_rooms(self):
+        """puts every talk without a room into the smallest free room that fits
+
+        Talks go by start time; rooms wait in a heap keyed by the time their
+        last placed talk ends and move to a capacity-sorted pool once it has.
+        Talks that already have a room keep it, a pooled room is only taken
+        if none of its bookings overlaps the talk. Returns the talks that
+        could not be placed.
+        """
+        busy = []  # (end_time of the talk placed last, room index)
+        free = sorted((room.capacity, i) for i, room in enumerate(self.rooms))
+        booked = {i for i, room in enumerate(self.rooms) if room.talks}
+        unplaced = []
+        talks = sorted(
+            (t for t in self.talks if t.room is None), key=lambda t: t.start_time
+        )
+        for talk in talks:
+            while busy and busy[0][0] <= talk.start_time:
+                i = heapq.heappop(busy)[1]
+                bisect.insort(free, (self.rooms[i].capacity, i))
+            # best fit, past the rooms that were booked by hand for that time
+            j = bisect.bisect_left(free, (talk.capacity, -1))
+            while j < len(free):
+                room = self.rooms[free[j][1]]
+                if free[j][1] not in booked:
+                    position = len(room.talks)  # all its talks ended already
+                    break
+                position = self._free_position(room, talk)
+                if position is not None:
+                    break
+                j += 1
+            if j == len(free):
+                unplaced.append(talk)
+                continue
+            i = free.pop(j)[1]
+            self.rooms[i].talks.insert(position, talk)
+            talk.room = self.rooms[i]
+            heapq.heappush(busy, (talk.end_time, i))
+        return unplaced
+
     def get_schedule(self, attendee: Attendee):
-        return [(talk.start_time, talk.end_time) for talk in attendee.talks]
+        return list(attendee.schedule)
@@ -1,24 +1,242 @@
-from datetime import datetime
-import copy
+from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+EPOCH = datetime(1970, 1, 1)
+NO_TIME = -(2**63)  # encodes a missing ttl
+NO_QUOTA = -1  # encodes a missing quota
+
+
+def encode_time(t: datetime | None) -> int:
+    """microseconds since EPOCH, timestamps are naive datetimes"""
+    if t is None:
+        return NO_TIME
+    return (t - EPOCH) // timedelta(microseconds=1)
+
+
+def decode_time(us: int) -> datetime | None:
+    if us == NO_TIME:
+        return None
+    return EPOCH + timedelta(microseconds=us)
 
 
 class File:
+    __slots__ = ("name", "size", "timestamp", "ttl", "version")
+
     def __init__(self, name: str, size: int, timestamp: datetime, ttl: datetime):
         self.name = name
         self.size = size
         self.timestamp = timestamp
         self.ttl = ttl
+        self.version = 0  # generation that owns this node, older ones are shared
+
+    def clone(self, version: int):
+        file = File(self.name, self.size, self.timestamp, self.ttl)
+        file.version = version
+        return file
+
+
+class PrefixIndex:
+    """sorted file names, each mapped to the paths that end in that name"""
+
+    def __init__(self):
+        self.names = []  # sorted, distinct
+        self.entries = {}  # key: name, value: {path: File}
+
+    def add(self, path: tuple, file: File):
+        if file.name not in self.entries:
+            bisect.insort(self.names, file.name)
+            self.entries[file.name] = {}
+        self.entries[file.name][path] = file
+
+    def remove(self, path: tuple):
+        name = path[-1]
+        paths = self.entries[name]
+        del paths[path]
+        if not paths:
+            del self.entries[name]
+            del self.names[bisect.bisect_left(self.names, name)]
+
+    def clear(self):
+        self.names = []
+        self.entries = {}
+
+    def matches(self, prefix: str):
+        """yields (path, file) for every file name starting with prefix"""
+        i = bisect.bisect_left(self.names, prefix)
+        while i < len(self.names) and self.names[i].startswith(prefix):
+            yield from self.entries[self.names[i]].items()
+            i += 1
+
+
+class TinyMap(MutableMapping):
+    """name -> node map for small directories
+
+    Keys followed by values in one tuple, a fraction of the memory of a
+    small dict. Writes build a new tuple, so a copy shares it until then.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: tuple = ()):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) >> 1
+
+    def _find(self, key):
+        try:
+            return self.data.index(key, 0, len(self.data) >> 1)
+        except ValueError:
+            return -1
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.data[i + len(self)]
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        return default if i < 0 else self.data[i + len(self)]
+
+    def __setitem__(self, key, value):
+        data, n = self.data, len(self)
+        i = self._find(key)
+        if i < 0:
+            self.data = data[:n] + (key,) + data[n:] + (value,)
+        else:
+            self.data = data[: n + i] + (value,) + data[n + i + 1 :]
+
+    def __delitem__(self, key):
+        data, n = self.data, len(self)
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        self.data = data[:i] + data[i + 1 : n + i] + data[n + i + 1 :]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.data[: len(self)]
+
+    def values(self):
+        return self.data[len(self) :]
+
+    def items(self):
+        return tuple(zip(self.keys(), self.values()))
+
+    def copy(self):
+        return TinyMap(self.data)
+
+    def __repr__(self):
+        return f"TinyMap({dict(self.items())!r})"
 
 
 class Directory:
+    __slots__ = (
+        "name",
+        "children",
+        "version",
+        "path",
+        "index",
+        "total_size",
+        "file_count",
+        "quota",
+    )
+
+    tiny_size = 8  # children stay in a TinyMap up to this many, 0 always uses dicts
+
     def __init__(self, name: str):
         self.name = name
-        self.children = {}  # key: name, value: File or Directory
+        # key: name, value: File or Directory
+        self.children = TinyMap() if self.tiny_size else {}
+        self.version = 0
+        self.path = ()  # names from the server root, set when attached
+        self.index = None  # PrefixIndex of the server this directory is in
+        self.total_size = 0  # bytes of every file below, kept by add/delete
+        self.file_count = 0
+        self.quota = None  # max total_size, checked on upload
+
+    def clone(self, version: int):
+        """shallow copy, children are shared until they are written"""
+        directory = Directory.__new__(Directory)  # every slot is set below
+        directory.name = self.name
+        directory.children = self.children.copy()  # a TinyMap shares its tuple
+        directory.version = version
+        directory.path = self.path
+        directory.index = self.index
+        directory.total_size = self.total_size
+        directory.file_count = self.file_count
+        directory.quota = self.quota
+        return directory
+
+    def attach(self, index: PrefixIndex, path: tuple):
+        """registers this directory and every file below it with index
+
+        Also recomputes the size aggregates of the subtree.
+        """
+        self.index = index
+        self.path = path
+        total_size = file_count = 0
+        for key, value in self.children.items():
+            if isinstance(value, File):
+                index.add(path + (key,), value)
+                total_size += value.size
+                file_count += 1
+            if isinstance(value, Directory):
+                value.attach(index, path + (key,))
+                total_size += value.total_size
+                file_count += value.file_count
+        self.total_size = total_size
+        self.file_count = file_count
+
+    def _account(self, item, sign: int):
+        if isinstance(item, File):
+            self.total_size += sign * item.size
+            self.file_count += sign
+        else:
+            self.total_size += sign * item.total_size
+            self.file_count += sign * item.file_count
+
+    def _set_child(self, name: str, item):
+        children = self.children
+        if (
+            type(children) is TinyMap
+            and len(children) >= self.tiny_size
+            and name not in children
+        ):
+            self.children = children = dict(children.items())
+        children[name] = item
+
+    def _detach(self, item):
+        if isinstance(item, File):
+            self.index.remove(self.path + (item.name,))
+        if isinstance(item, Directory):
+            for value in list(item.children.values()):
+                item._detach(value)
 
     def add(self, item):
         if item.name in self.children:
             raise RuntimeError(f"{item.name} already exists.")
-        self.children[item.name] = item
+        self._set_child(item.name, item)
+        if self.index is not None:
+            if isinstance(item, File):
+                self.index.add(self.path + (item.name,), item)
+            if isinstance(item, Directory):
+                item.attach(self.index, self.path + (item.name,))
+        self._account(item, 1)
 
     def get(self, name):
         if name not in self.children:
@@ -28,86 +246,667 @@ class Directory:
     def delete(self, name):
         if name not in self.children:
             raise Exception("Name does not exist.")
+        item = self.children[name]
+        if self.index is not None:
+            self._detach(item)
+        self._account(item, -1)
         del self.children[name]
 
 
+class RetentionPolicy:
+    """which saved states survive compaction, None disables a rule"""
+
+    def __init__(
+        self,
+        keep_last: int | None = None,
+        interval: timedelta | None = None,
+        older_than: timedelta | None = None,
+    ):
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last must be at least 1.")
+        if (interval is None) != (older_than is None):
+            raise ValueError("interval and older_than go together.")
+        self.keep_last = keep_last
+        self.interval = interval  # keep one state per interval ...
+        self.older_than = older_than  # ... for states older than this
+
+    def thin(self, times: list):
+        """keeps the latest timestamp of every interval bucket"""
+        kept = []
+        for t in times:
+            bucket = (t - datetime.min) // self.interval
+            if kept and (kept[-1] - datetime.min) // self.interval == bucket:
+                kept[-1] = t
+            else:
+                kept.append(t)
+        return kept
+
+
+class Journal:
+    """append-only binary log of *_AT calls, written and fsynced in groups
+
+    Record: length and crc32 of the payload, then the payload, an op code
+    followed by its arguments. A torn or corrupt tail ends the replay.
+
+    Calls return before their record is fsynced: a group is written once it
+    holds group_size records or its oldest record is max_delay seconds old,
+    so a crash loses at most the calls of the last max_delay seconds.
+    group_size=1 fsyncs every record before its call returns.
+    """
+
+    HEADER = struct.Struct("<II")
+    OPS = {  # name: (code, argument kinds) t: time, s: str, q: int, o: quota,
+        # p: list of (str, str) pairs
+        "FILE_UPLOAD_AT": (1, "tsqt"),
+        "FILE_GET_AT": (2, "ts"),
+        "FILE_COPY_AT": (3, "tss"),
+        "FILE_SEARCH_AT": (4, "tsq"),
+        "ROLLBACK": (5, "t"),
+        "DIR_QUOTA_AT": (6, "tso"),
+        "FILE_COPY_MANY_AT": (7, "tp"),
+    }
+    NAMES = {code: name for name, (code, _) in OPS.items()}
+
+    def __init__(self, path: str, group_size: int = 64, max_delay: float = 0.05):
+        self.path = path
+        self.group_size = group_size  # records per write and fsync
+        self.max_delay = max_delay  # seconds, by then a background flush runs
+        self.pending = []
+        self.lock = threading.Lock()  # pending and file, shared with the timer
+        self.timer = None
+        self.file = open(path, "ab")
+
+    def append(self, op: str, *args):
+        code, kinds = self.OPS[op]
+        payload = [struct.pack("<B", code)]
+        for kind, arg in zip(kinds, args):
+            if kind == "t":
+                payload.append(struct.pack("<q", encode_time(arg)))
+            elif kind == "q":
+                payload.append(struct.pack("<q", arg))
+            elif kind == "o":
+                payload.append(struct.pack("<q", NO_QUOTA if arg is None else arg))
+            elif kind == "p":
+                payload.append(struct.pack("<I", len(arg)))
+                for text in (text for pair in arg for text in pair):
+                    data = text.encode()
+                    payload.append(struct.pack("<I", len(data)) + data)
+            else:
+                data = arg.encode()
+                payload.append(struct.pack("<I", len(data)) + data)
+        payload = b"".join(payload)
+        record = self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            self.pending.append(record)
+            if len(self.pending) >= self.group_size:
+                self._write()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.max_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def _write(self):
+        # with self.lock held
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            self.file.write(b"".join(self.pending))
+            self.pending = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def flush(self):
+        with self.lock:
+            if not self.file.closed:
+                self._write()
+
+    def truncate(self):
+        """empties the journal once a checkpoint holds its records"""
+        with self.lock:
+            self.pending = []
+            self.file.truncate(0)
+            self._write()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._write()
+                self.file.close()
+
+    @classmethod
+    def replay(cls, path: str):
+        """yields (end, op, args) for every intact record in the journal at path
+
+        end is the offset just past the record, the last one is where the
+        intact part of the journal ends.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + cls.HEADER.size <= len(data):
+            length, crc = cls.HEADER.unpack_from(data, offset)
+            start = offset + cls.HEADER.size
+            payload = data[start : start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset = start + length
+            op = cls.NAMES[payload[0]]
+            args = []
+            pos = 1
+            for kind in cls.OPS[op][1]:
+                if kind == "s":
+                    (n,) = struct.unpack_from("<I", payload, pos)
+                    args.append(payload[pos + 4 : pos + 4 + n].decode())
+                    pos += 4 + n
+                elif kind == "p":
+                    (count,) = struct.unpack_from("<I", payload, pos)
+                    pos += 4
+                    texts = []
+                    for _ in range(2 * count):
+                        (n,) = struct.unpack_from("<I", payload, pos)
+                        texts.append(payload[pos + 4 : pos + 4 + n].decode())
+                        pos += 4 + n
+                    args.append(list(zip(texts[::2], texts[1::2])))
+                else:
+                    (value,) = struct.unpack_from("<q", payload, pos)
+                    if kind == "t":
+                        value = decode_time(value)
+                    elif kind == "o" and value == NO_QUOTA:
+                        value = None
+                    args.append(value)
+                    pos += 8
+            yield offset, op, args
+
+
 class Server:
-    def __init__(self, name: str):
+    def __init__(
+        self,
+        name: str,
+        retention: RetentionPolicy | None = None,
+        dir_cache_size: int = 1024,
+        journal: Journal | None = None,
+    ):
         self.name = name
+        self.journal = journal
+        self.index = PrefixIndex()
         self.root = Directory(name)
+        self.root.attach(self.index, ())
         self.state_history = {}  # key: timestamp, value: self.root
+        self.state_times = []  # sorted keys of state_history
+        self.thinned = 0  # state_times[:thinned] are already compacted
+        self.retention = retention
+        self.version = 0  # nodes with an older version belong to a saved state
+        self.expiry = []  # heap of (ttl, path), may hold entries of removed files
+        self.purged_total = 0
+        self.purge_log = deque(maxlen=1024)  # (timestamp, files purged) per tick
+        self.dir_cache = OrderedDict()  # LRU, key: directory path, value: Directory
+        self.dir_cache_size = dir_cache_size
 
     def _parse_path(self, path: str):
         return path.split("/")
 
+    def _cache_put(self, key: tuple, directory: Directory):
+        self.dir_cache[key] = directory
+        self.dir_cache.move_to_end(key)
+        if len(self.dir_cache) > self.dir_cache_size:
+            self.dir_cache.popitem(last=False)
+
+    def _invalidate(self, prefix: tuple):
+        """drops the cached directories at and below prefix"""
+        n = len(prefix)
+        for key in [k for k in self.dir_cache if k[:n] == prefix]:
+            del self.dir_cache[key]
+
     def _get_parent_dir(self, path_parts):
+        key = tuple(path_parts[:-1])
+        if key in self.dir_cache:
+            self.dir_cache.move_to_end(key)
+            return self.dir_cache[key]
         current = self.root
-        for part in path_parts[:-1]:
+        for part in key:
             current = current.get(part)
             if not isinstance(current, Directory):
                 raise RuntimeError("Invalid path.")
+        self._cache_put(key, current)
         return current
 
-    def _recursive_dfs(self, current_dir: Directory, prefix: str):
-        """returns all files that include prefix"""
-        all_files = []
-        for key, value in current_dir.children.items():
-            if isinstance(value, File) and value.name.startswith(prefix):
-                all_files.append(value)
-            if isinstance(value, Directory):
-                all_files.extend(self._recursive_dfs(value, prefix))
-        return all_files
+    def _get_writable_child(self, parent: Directory, name: str):
+        child = parent.get(name)
+        if not isinstance(child, Directory):
+            raise RuntimeError("Invalid path.")
+        if child.version != self.version:
+            child = child.clone(self.version)
+            parent._set_child(name, child)
+            if child.path in self.dir_cache:
+                self.dir_cache[child.path] = child
+        return child
+
+    def _get_writable_dirs(self, path_parts_list):
+        """parents of many paths, copying shared directories on the way
+
+        Paths are walked in sorted order so a common prefix is walked once.
+        """
+        if self.root.version != self.version:
+            self.root = self.root.clone(self.version)
+            if () in self.dir_cache:
+                self.dir_cache[()] = self.root
+        keys = [tuple(path_parts[:-1]) for path_parts in path_parts_list]
+        resolved = {}
+        stack = []  # (name, Directory) along the last walked path
+        for key in sorted(set(keys)):
+            cached = self.dir_cache.get(key)
+            if cached is not None and cached.version == self.version:
+                # writable nodes are only reachable through writable parents
+                self.dir_cache.move_to_end(key)
+                resolved[key] = cached
+                continue
+            n = 0
+            while n < len(stack) and n < len(key) and stack[n][0] == key[n]:
+                n += 1
+            del stack[n:]
+            current = stack[-1][1] if stack else self.root
+            for part in key[n:]:
+                current = self._get_writable_child(current, part)
+                stack.append((part, current))
+            resolved[key] = current
+            self._cache_put(key, current)
+        return [resolved[key] for key in keys]
+
+    def _get_writable_dir(self, path_parts):
+        """like _get_parent_dir, but copies every shared directory on the way"""
+        return self._get_writable_dirs([path_parts])[0]
+
+    def _get_writable_file(self, parent: Directory, name: str):
+        file = parent.get(name)
+        if isinstance(file, File) and file.version != self.version:
+            file = file.clone(self.version)
+            parent._set_child(name, file)
+            self.index.add(parent.path + (name,), file)
+        return file
+
+    def _get_dir(self, dir_path: str):
+        """the directory at dir_path, "" is the root"""
+        path_parts = self._parse_path(dir_path) if dir_path else []
+        return self._get_parent_dir(path_parts + [None])
+
+    def _lineage(self, path: tuple):
+        """the root and every directory down to path, O(depth)"""
+        dirs = [self.root]
+        for name in path:
+            dirs.append(dirs[-1].children[name])
+        return dirs
+
+    def _propagate(self, path: tuple, size: int, files: int, lineage=None):
+        """adds to the aggregates above the directory at path, which add and
+        delete already updated; that path must be writable"""
+        for directory in (lineage or self._lineage(path))[:-1]:
+            directory.total_size += size
+            directory.file_count += files
+
+    def _check_quota(self, lineage: list, growth: int):
+        """raises before a write that grows every directory in lineage by growth
+        past its quota; writes that free space always go through"""
+        if growth <= 0:
+            return
+        for directory in lineage:
+            quota = directory.quota
+            if quota is not None and directory.total_size + growth > quota:
+                raise RuntimeError("Quota exceeded.")
+
+    def _add_file(self, parent: Directory, file: File, lineage=None):
+        parent.add(file)
+        self._propagate(parent.path, file.size, 1, lineage)
+        if file.ttl:
+            heapq.heappush(self.expiry, (file.ttl, parent.path + (file.name,)))
+
+    def _purge(self, timestamp: datetime):
+        """removes every file whose ttl is not after timestamp"""
+        purged = 0
+        while self.expiry and self.expiry[0][0] <= timestamp:
+            ttl, path = heapq.heappop(self.expiry)
+            file = self.index.entries.get(path[-1], {}).get(path)
+            if file is None or file.ttl != ttl:
+                continue  # overwritten or removed since it was queued
+            self._get_writable_dir(path).delete(path[-1])
+            self._propagate(path[:-1], -file.size, -1)
+            purged += 1
+        if purged:
+            self.purged_total += purged
+            self.purge_log.append((timestamp, purged))
+        return purged
+
+    def _log(self, op: str, *args):
+        if self.journal is not None:
+            self.journal.append(op, *args)
 
     def _save_state(self, timestamp: datetime):
-        self.state_history[timestamp] = copy.deepcopy(self.root)
+        # the current tree becomes read-only, later writes copy the touched path
+        if timestamp not in self.state_history:
+            if not self.state_times or self.state_times[-1] < timestamp:
+                self.state_times.append(timestamp)
+            else:
+                i = bisect.bisect_left(self.state_times, timestamp)
+                self.state_times.insert(i, timestamp)
+                self.thinned = min(self.thinned, max(i - 1, 0))
+        self.state_history[timestamp] = self.root
+        self.version += 1
+        if self.retention:
+            self._compact()
+
+    def _compact(self):
+        times = self.state_times
+        policy = self.retention
+        dropped = []
+        if policy.older_than is not None:
+            cutoff = bisect.bisect_left(times, times[-1] - policy.older_than)
+            if cutoff > self.thinned:
+                # buckets are only closed once a newer bucket is old as well
+                start = self.thinned
+                kept = policy.thin(times[start:cutoff])
+                dropped.extend(set(times[start:cutoff]) - set(kept))
+                times[start:cutoff] = kept
+                self.thinned = start + len(kept) - 1
+        if policy.keep_last is not None and len(times) > policy.keep_last:
+            excess = len(times) - policy.keep_last
+            dropped.extend(times[:excess])
+            del times[:excess]
+            self.thinned = max(self.thinned - excess, 0)
+        for t in dropped:
+            del self.state_history[t]
 
     def FILE_UPLOAD_AT(
         self, timestamp: datetime, file_path: str, size: int, ttl: datetime | None
     ):
+        self._purge(timestamp)
         path_parts = self._parse_path(file_path)
         file_name = path_parts[-1]
-        parent = self._get_parent_dir(path_parts)
+        parent = self._get_writable_dir(path_parts)
         if file_name in parent.children:
             raise RuntimeError("File already exists.")
-        parent.add(File(file_name, size, timestamp, ttl))
+        lineage = self._lineage(parent.path)
+        self._check_quota(lineage, size)
+        file = File(file_name, size, timestamp, ttl)
+        file.version = self.version
+        self._add_file(parent, file, lineage)
         self._save_state(timestamp)
+        self._log("FILE_UPLOAD_AT", timestamp, file_path, size, ttl)
 
     def FILE_GET_AT(self, timestamp: datetime, file_path: str):
+        self._purge(timestamp)
         path_parts = self._parse_path(file_path)
         file_name = path_parts[-1]
-        parent = self._get_parent_dir(path_parts)
-        file = parent.get(file_name)
+        parent = self._get_writable_dir(path_parts)
+        file = self._get_writable_file(parent, file_name)
+        if not isinstance(file, File):
+            return None
         file.timestamp = timestamp
         self._save_state(timestamp)
-        return file.size if isinstance(file, File) else None
+        self._log("FILE_GET_AT", timestamp, file_path)
+        return file.size
 
-    def FILE_COPY_AT(self, timestamp: datetime, source: str, dest: str):
-        path_parts_source = self._parse_path(source)
-        path_parts_dest = self._parse_path(dest)
-        source_dir = self._get_parent_dir(path_parts_source)
-        dest_dir = self._get_parent_dir(path_parts_dest)
-        source_file = source_dir.get(path_parts_source[-1])
+    def _copy(self, timestamp, source_dir, source_name, dest_dir, dest_name):
+        source_file = self._get_writable_file(source_dir, source_name)
         dest_file = File(
-            path_parts_dest[-1], source_file.size, timestamp, source_file.ttl
+            dest_name, source_file.size, timestamp, source_file.ttl
         )  # copy file with src ttl
-        if dest_file.name in dest_dir.children:
-            dest_dir.delete(dest_file.name)
-        dest_dir.add(dest_file)
+        dest_file.version = self.version
+        replaced = dest_dir.children.get(dest_name)
+        if isinstance(replaced, File):
+            freed, files = replaced.size, 1
+        elif replaced is not None:
+            freed, files = replaced.total_size, replaced.file_count
+        else:
+            freed, files = 0, 0
+        lineage = self._lineage(dest_dir.path)
+        self._check_quota(lineage, dest_file.size - freed)
+        if replaced is not None:
+            dest_dir.delete(dest_name)
+            self._propagate(dest_dir.path, -freed, -files, lineage)
+            if isinstance(replaced, Directory):
+                self._invalidate(replaced.path)
+        self._add_file(dest_dir, dest_file, lineage)
         source_file.timestamp = timestamp
+        return isinstance(replaced, Directory)
+
+    def FILE_COPY_AT(self, timestamp: datetime, source: str, dest: str):
+        self._purge(timestamp)
+        path_parts_source = self._parse_path(source)
+        path_parts_dest = self._parse_path(dest)
+        source_dir, dest_dir = self._get_writable_dirs(
+            [path_parts_source, path_parts_dest]
+        )
+        self._copy(
+            timestamp, source_dir, path_parts_source[-1], dest_dir, path_parts_dest[-1]
+        )
         self._save_state(timestamp)
+        self._log("FILE_COPY_AT", timestamp, source, dest)
+
+    def FILE_COPY_MANY_AT(self, timestamp: datetime, pairs: list[tuple[str, str]]):
+        """FILE_COPY_AT for every (source, dest) pair, in order, as one state
 
-    def FILE_SEARCH_AT(self, timestamp: datetime, prefix: str):
-        prefix_list = self._recursive_dfs(self.root, prefix)
-        not_dead = [f for f in prefix_list if not f.ttl or f.ttl > timestamp]
-        for f in not_dead:
+        All or nothing: when a pair fails, the tree goes back to how it was
+        before the first copy and the error is raised.
+        """
+        self._purge(timestamp)
+        before = self.root
+        self.version += 1  # before becomes read-only, the batch writes copies
+        try:
+            parts = [(self._parse_path(s), self._parse_path(d)) for s, d in pairs]
+            dirs = self._get_writable_dirs([p for pair in parts for p in pair])
+            for i, (source, dest) in enumerate(parts):
+                replaced_dir = self._copy(
+                    timestamp, dirs[2 * i], source[-1], dirs[2 * i + 1], dest[-1]
+                )
+                if replaced_dir:
+                    # a directory was replaced, resolve the remaining paths again
+                    rest = [p for pair in parts[i + 1 :] for p in pair]
+                    dirs[2 * i + 2 :] = self._get_writable_dirs(rest)
+        except Exception:
+            self.root = before
+            self.version += 1
+            self._rebuild()
+            raise
+        self._save_state(timestamp)
+        self._log("FILE_COPY_MANY_AT", timestamp, pairs)
+
+    def FILE_SEARCH_AT(self, timestamp: datetime, prefix: str, limit: int = 10):
+        self._purge(timestamp)
+        heap = [(-f.size, f.name, path) for path, f in self.index.matches(prefix)]
+        heapq.heapify(heap)
+        for _, _, path in heap:
+            parent = self._get_writable_dir(path)
+            f = self._get_writable_file(parent, path[-1])
             f.timestamp = timestamp
-        not_dead.sort(key=lambda f: (-f.size, f.name))
+        top = [heapq.heappop(heap) for _ in range(min(limit, len(heap)))]
+        self._save_state(timestamp)
+        self._log("FILE_SEARCH_AT", timestamp, prefix, limit)
+        return [(name, -size) for size, name, _ in top]
+
+    def DIR_QUOTA_AT(self, timestamp: datetime, dir_path: str, quota: int | None):
+        """limits the bytes under dir_path to quota, None lifts the limit"""
+        if quota is not None and quota < 0:
+            raise RuntimeError("Quota must not be negative.")
+        self._purge(timestamp)
+        path_parts = self._parse_path(dir_path) if dir_path else []
+        directory = self._get_writable_dir(path_parts + [None])
+        directory.quota = quota
         self._save_state(timestamp)
-        return [(f.name, f.size) for f in not_dead[:10]]
+        self._log("DIR_QUOTA_AT", timestamp, dir_path, quota)
+
+    def DIR_USAGE_AT(self, timestamp: datetime, dir_path: str):
+        """(total size, file count) of the files under dir_path, read from the
+        aggregates; the purge leaves only live files, so nothing is saved"""
+        self._purge(timestamp)
+        directory = self._get_dir(dir_path)
+        return directory.total_size, directory.file_count
+
+    def DIR_TOP_AT(self, timestamp: datetime, dir_path: str, limit: int = 10):
+        """the limit largest directories below dir_path as (path, total size)
+
+        A directory is never larger than its parent, so a best-first walk
+        from dir_path only opens the directories it returns.
+        """
+        self._purge(timestamp)
+        heap = []
+
+        def push(directory):
+            for child in directory.children.values():
+                if isinstance(child, Directory):
+                    heapq.heappush(heap, (-child.total_size, child.path, child))
+
+        push(self._get_dir(dir_path))
+        top = []
+        while heap and len(top) < limit:
+            size, path, directory = heapq.heappop(heap)
+            top.append(("/".join(path), -size))
+            push(directory)
+        return top
+
+    def _rebuild(self):
+        """recomputes everything derived from self.root"""
+        self.dir_cache.clear()
+        self.index.clear()
+        self.root.attach(self.index, ())
+        self.expiry = [
+            (f.ttl, path)
+            for paths in self.index.entries.values()
+            for path, f in paths.items()
+            if f.ttl
+        ]
+        heapq.heapify(self.expiry)
 
     def ROLLBACK(self, timestamp: datetime):
-        valid_timestamps = [t for t in self.state_history if t <= timestamp]
-        if not valid_times:
+        i = bisect.bisect_right(self.state_times, timestamp)
+        if not i:
             raise RuntimeError("No rollback state found.")
-        closest = max(valid_times)
-        self.root = copy.deepcopy(self.state_history[closest])
+        closest = self.state_times[i - 1]
+        # saved states are never written to, so the tree can be shared as is
+        self.root = self.state_history[closest]
+        self.version += 1
+        self._rebuild()
+        self._log("ROLLBACK", timestamp)
+
+    CHECKPOINT_MAGIC = b"FHSC0002"
+    LEGACY_MAGIC = b"FHSC0001"  # no quotas in directory records
+
+    def checkpoint(self, path: str):
+        """writes the current tree and every saved state, then empties the journal
+
+        Nodes shared between states are written once; a directory record
+        lists the ids of its children, which always come before it.
+        """
+        ids = {}  # key: id(node), value: record number
+        records = []
+
+        def write(node):
+            if id(node) in ids:
+                return ids[id(node)]
+            name = node.name.encode()
+            if isinstance(node, File):
+                timestamp, ttl = encode_time(node.timestamp), encode_time(node.ttl)
+                record = (
+                    struct.pack("<BI", 0, len(name))
+                    + name
+                    + struct.pack("<qqq", node.size, timestamp, ttl)
+                )
+            else:
+                children = [write(child) for child in node.children.values()]
+                quota = NO_QUOTA if node.quota is None else node.quota
+                record = (
+                    struct.pack("<BI", 1, len(name))
+                    + name
+                    + struct.pack("<q", quota)
+                    + struct.pack(f"<I{len(children)}I", len(children), *children)
+                )
+            ids[id(node)] = len(records)
+            records.append(record)
+            return ids[id(node)]
+
+        states = [(t, write(self.state_history[t])) for t in self.state_times]
+        root = write(self.root)
+        with open(path + ".tmp", "wb") as f:
+            f.write(self.CHECKPOINT_MAGIC)
+            f.write(struct.pack("<I", len(records)))
+            f.writelines(records)
+            f.write(struct.pack("<I", len(states)))
+            for t, node in states:
+                f.write(struct.pack("<qI", encode_time(t), node))
+            f.write(struct.pack("<I", root))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        if self.journal is not None:
+            self.journal.truncate()
+
+    def load_checkpoint(self, path: str):
+        """replaces all state with the checkpoint at path, read through mmap"""
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            magic = data[: len(self.CHECKPOINT_MAGIC)]
+            if magic not in (self.CHECKPOINT_MAGIC, self.LEGACY_MAGIC):
+                raise RuntimeError("Not a checkpoint file.")
+            offset = len(self.CHECKPOINT_MAGIC)
+            (count,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            nodes = []
+            for _ in range(count):
+                kind, n = struct.unpack_from("<BI", data, offset)
+                offset += 5
+                name = data[offset : offset + n].decode()
+                offset += n
+                if kind == 0:
+                    size, timestamp, ttl = struct.unpack_from("<qqq", data, offset)
+                    offset += 24
+                    nodes.append(
+                        File(name, size, decode_time(timestamp), decode_time(ttl))
+                    )
+                else:
+                    directory = Directory(name)
+                    if magic == self.CHECKPOINT_MAGIC:
+                        (quota,) = struct.unpack_from("<q", data, offset)
+                        offset += 8
+                        directory.quota = None if quota == NO_QUOTA else quota
+                    (n,) = struct.unpack_from("<I", data, offset)
+                    children = struct.unpack_from(f"<{n}I", data, offset + 4)
+                    offset += 4 + 4 * n
+                    for child in children:
+                        directory._set_child(nodes[child].name, nodes[child])
+                    nodes.append(directory)
+            (count,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            self.state_history = {}
+            self.state_times = []
+            for _ in range(count):
+                t, node = struct.unpack_from("<qI", data, offset)
+                offset += 12
+                self.state_times.append(decode_time(t))
+                self.state_history[self.state_times[-1]] = nodes[node]
+            (root,) = struct.unpack_from("<I", data, offset)
+        self.root = nodes[root]
+        self.thinned = 0
+        self.version = 1  # every loaded node is shared
+        self._rebuild()
+
+    @classmethod
+    def recover(
+        cls, name: str, checkpoint_path: str, journal_path: str, **kwargs
+    ) -> "Server":
+        """latest checkpoint plus the journal tail, then keeps journaling
+
+        A torn or corrupt tail is cut off first, records appended after it
+        would never be replayed.
+        """
+        server = cls(name, **kwargs)
+        if os.path.exists(checkpoint_path):
+            server.load_checkpoint(checkpoint_path)
+        end = 0
+        for end, op, args in Journal.replay(journal_path):
+            getattr(server, op)(*args)  # only calls that succeeded were logged
+        if os.path.exists(journal_path) and os.path.getsize(journal_path) > end:
+            os.truncate(journal_path, end)
+        server.journal = Journal(journal_path)
+        return server
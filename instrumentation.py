@@ -0,0 +1,359 @@
+"""Opt-in call metrics and profiling for the simulator classes.
+
+Nothing is wrapped until a method is instrumented, so the cost while disabled
+is zero. Instrumenting replaces the method on its class with a wrapper that
+records the call count, a latency histogram, raised exceptions and, when a
+size probe is given, the size of the structure the call is about to scan.
+
+    metrics = Instrumentation()
+    instrument_simulators(metrics)
+    ...
+    metrics.write_prometheus("simulators.prom")
+    metrics.disable()
+"""
+
+from bisect import bisect_left
+from itertools import count
+import cProfile
+import functools
+import inspect
+import json
+import os
+import pstats
+import sys
+import time
+
+LATENCY_BOUNDS = [1e-6 * 2**k for k in range(25)]  # seconds, 1us .. ~17s
+SIZE_BOUNDS = [2**k for k in range(25)]
+
+
+class Histogram:
+    """counts per upper bound, the last count is for values above them all"""
+
+    def __init__(self, bounds: list):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, observations <= it), ending with ("+Inf", count)"""
+        total = 0
+        rows = []
+        for bound, n in zip(self.bounds + ["+Inf"], self.counts):
+            total += n
+            rows.append((bound, total))
+        return rows
+
+
+class MethodMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BOUNDS)
+        self.scanned = Histogram(SIZE_BOUNDS)
+
+
+class Instrumentation:
+    """registry of wrapped methods and their metrics"""
+
+    def __init__(self):
+        self.metrics = {}  # key "Class.method", value MethodMetrics
+        self.patches = []  # (cls, name, previous attribute), in patch order
+        self.instrumented = set()  # (cls, name)
+        self.profiles = {}  # key (cls, name), value (cProfile.Profile, wrapper)
+
+    def _patch(self, cls, name: str, wrapper):
+        previous = cls.__dict__[name]
+        self.patches.append((cls, name, previous))
+        wrapper = functools.wraps(previous)(wrapper)
+        setattr(cls, name, wrapper)
+        return wrapper
+
+    def instrument(self, cls, name: str, size=None):
+        """wraps cls.name; size(obj, *args, **kwargs) -> items about to be scanned"""
+        if (cls, name) in self.instrumented:
+            raise RuntimeError(f"{cls.__name__}.{name} is already instrumented.")
+        self.instrumented.add((cls, name))
+        key = f"{cls.__name__}.{name}"
+        metric = self.metrics.setdefault(key, MethodMetrics(key))
+        original = cls.__dict__[name]
+
+        def probe(obj, args, kwargs):
+            if size is not None:
+                try:
+                    metric.scanned.observe(size(obj, *args, **kwargs))
+                except Exception:
+                    pass  # the call itself reports bad arguments
+
+        if inspect.isgeneratorfunction(original):
+            # time the whole iteration, the call only creates the generator
+            def wrapper(obj, *args, **kwargs):
+                probe(obj, args, kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    yield from original(obj, *args, **kwargs)
+                except Exception:
+                    metric.errors += 1
+                    raise
+                finally:
+                    metric.latency.observe((time.perf_counter_ns() - start) / 1e9)
+
+        else:
+
+            def wrapper(obj, *args, **kwargs):
+                probe(obj, args, kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return original(obj, *args, **kwargs)
+                except Exception:
+                    metric.errors += 1
+                    raise
+                finally:
+                    metric.latency.observe((time.perf_counter_ns() - start) / 1e9)
+
+        self._patch(cls, name, wrapper)
+
+    def profile(self, cls, name: str, every: int = 100):
+        """runs every `every`-th call of cls.name under cProfile, until stop_profile
+
+        A generator method is profiled while it produces each item.
+        """
+        if (cls, name) in self.profiles:
+            raise RuntimeError(f"{cls.__name__}.{name} is already profiled.")
+        profiler = cProfile.Profile()
+        calls = count()
+        current = cls.__dict__[name]
+
+        if inspect.isgeneratorfunction(current):
+            # profile every step of the iteration, not the consumer in between
+            def wrapper(obj, *args, **kwargs):
+                generator = current(obj, *args, **kwargs)
+                if next(calls) % every:
+                    return (yield from generator)
+                while True:
+                    profiler.enable()
+                    try:
+                        item = next(generator)
+                    except StopIteration as stop:
+                        return stop.value
+                    finally:
+                        profiler.disable()
+                    yield item
+
+        else:
+
+            def wrapper(obj, *args, **kwargs):
+                if next(calls) % every:
+                    return current(obj, *args, **kwargs)
+                profiler.enable()
+                try:
+                    return current(obj, *args, **kwargs)
+                finally:
+                    profiler.disable()
+
+        self.profiles[(cls, name)] = (profiler, self._patch(cls, name, wrapper))
+        return profiler
+
+    def stop_profile(self, cls, name: str) -> pstats.Stats | None:
+        """detaches the profiler of cls.name, None if nothing was sampled"""
+        profiler, wrapper = self.profiles[(cls, name)]
+        if cls.__dict__[name] is not wrapper:
+            raise RuntimeError("Method was wrapped again after profiling.")
+        del self.profiles[(cls, name)]
+        i = max(i for i, (c, n, _) in enumerate(self.patches) if c is cls and n == name)
+        setattr(cls, name, self.patches.pop(i)[2])
+        try:
+            return pstats.Stats(profiler)
+        except TypeError:  # no sampled call
+            return None
+
+    def disable(self):
+        """restores every wrapped method, metrics are kept"""
+        for cls, name, previous in reversed(self.patches):
+            setattr(cls, name, previous)
+        self.patches = []
+        self.instrumented = set()
+        self.profiles = {}
+
+    def reset(self):
+        for key in self.metrics:
+            self.metrics[key] = MethodMetrics(key)
+
+    def to_json(self) -> dict:
+        def histogram(h):
+            return {
+                "count": h.count,
+                "sum": h.sum,
+                "buckets": [[b, n] for b, n in h.cumulative()],
+            }
+
+        return {
+            key: {
+                "calls": m.latency.count,
+                "errors": m.errors,
+                "latency_seconds": histogram(m.latency),
+                "scanned_items": histogram(m.scanned),
+            }
+            for key, m in self.metrics.items()
+        }
+
+    def to_prometheus(self, prefix: str = "simulator") -> str:
+        lines = [
+            f"# HELP {prefix}_call_errors_total Calls that raised.",
+            f"# TYPE {prefix}_call_errors_total counter",
+        ]
+        for key, m in self.metrics.items():
+            lines.append(f'{prefix}_call_errors_total{{method="{key}"}} {m.errors}')
+        for metric, help_text, attribute in (
+            ("call_seconds", "Call latency.", "latency"),
+            ("scanned_items", "Size of the structure a call scans.", "scanned"),
+        ):
+            name = f"{prefix}_{metric}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for key, m in self.metrics.items():
+                h = getattr(m, attribute)
+                if not h.count:
+                    continue
+                for bound, n in h.cumulative():
+                    lines.append(f'{name}_bucket{{method="{key}",le="{bound}"}} {n}')
+                lines.append(f'{name}_sum{{method="{key}"}} {h.sum}')
+                lines.append(f'{name}_count{{method="{key}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "simulator"):
+        """atomic write, for the node exporter textfile collector"""
+        with open(path + ".tmp", "w") as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(path + ".tmp", path)
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+
+def _path_depth(server, timestamp, path, *args):
+    return path.count("/") + 1
+
+
+def _prefix_names(server, timestamp, prefix, *args):
+    """distinct file names starting with prefix, two bisects instead of a walk"""
+    names = server.index.names
+    return bisect_left(names, prefix + "\U0010ffff") - bisect_left(names, prefix)
+
+
+def _received(app, username, *args):
+    return len(app.users[username].received)
+
+
+def _blocks(app, username):
+    user = app.users[username]
+    return len(user.wantstoblock) + len(user.wasblocked)
+
+
+def instrument_simulators(metrics: Instrumentation, app_impl=None):
+    """instruments the hot methods of every simulator with their size probes
+
+    app_impl is the messaging AppImpl class, taken from the app_logic package
+    when it was imported and not given.
+    """
+    import confscheduling
+    import filehostingsystem
+    import pethotel
+    import studentscheduling
+
+    fhs = filehostingsystem
+    for name in (
+        "FILE_UPLOAD_AT",
+        "FILE_GET_AT",
+        "FILE_COPY_AT",
+        "DIR_QUOTA_AT",
+        "DIR_USAGE_AT",
+    ):
+        metrics.instrument(fhs.Server, name, _path_depth)
+    # best-first walk, opens about limit directories
+    metrics.instrument(
+        fhs.Server, "DIR_TOP_AT", lambda server, timestamp, path, limit=10: limit
+    )
+    metrics.instrument(
+        fhs.Server, "FILE_COPY_MANY_AT", lambda server, timestamp, pairs: len(pairs)
+    )
+    metrics.instrument(fhs.Server, "FILE_SEARCH_AT", _prefix_names)
+    metrics.instrument(
+        fhs.Server,
+        "ROLLBACK",
+        lambda server, timestamp: sum(map(len, server.index.entries.values())),
+    )
+    # nodes copied by the copy-on-write writes, and the entries each one copies
+    metrics.instrument(fhs.File, "clone", lambda file, version: 1)
+    metrics.instrument(
+        fhs.Directory,
+        "clone",
+        lambda directory, version: (
+            0 if type(directory.children) is fhs.TinyMap else len(directory.children)
+        ),
+    )
+
+    if app_impl is None and "app_logic.app_impl" in sys.modules:
+        app_impl = sys.modules["app_logic.app_impl"].AppImpl
+    if app_impl is not None:
+        metrics.instrument(app_impl, "create_user", lambda app, name: len(app.users))
+        metrics.instrument(app_impl, "delete_user", _blocks)
+        metrics.instrument(app_impl, "send_message")
+        metrics.instrument(
+            app_impl, "send_many", lambda app, sender, receivers, text: len(receivers)
+        )
+        metrics.instrument(app_impl, "send_batch", lambda app, items: len(items))
+        metrics.instrument(app_impl, "get_messages", _received)
+        metrics.instrument(app_impl, "get_latest_messages", _received)
+        metrics.instrument(app_impl, "block_user")
+
+    conf = confscheduling.Conference
+    metrics.instrument(conf, "add_attendee", lambda c, attendee: len(c.attendees))
+    metrics.instrument(
+        conf, "register_for_talk", lambda c, attendee, talk: len(attendee.schedule)
+    )
+    metrics.instrument(conf, "register_batch", lambda c, pairs: len(pairs))
+    metrics.instrument(conf, "assign_all_rooms", lambda c: len(c.talks))
+    metrics.instrument(conf, "get_schedule", lambda c, attendee: len(attendee.schedule))
+
+    hotel = pethotel.PetHotel
+    for name in ("check_in", "check_out", "auto_assign"):
+        metrics.instrument(hotel, name)
+    metrics.instrument(hotel, "check_in_many", lambda h, pets: len(pets))
+    metrics.instrument(hotel, "check_out_many", lambda h, pets: len(pets))
+    metrics.instrument(
+        hotel,
+        "list_pets",
+        lambda h, species=None, customer=None, checked_in=None: len(
+            h.checked_in_pets if checked_in else h.pets
+        ),
+    )
+
+    uni = studentscheduling.University
+    metrics.instrument(
+        uni,
+        "enroll_student_in_course",
+        lambda u, student_id, course_id: len(u.students[student_id].enrolled_courses),
+    )
+    metrics.instrument(
+        uni,
+        "schedule_course",
+        lambda u, course_id, *args: len(u.courses[course_id].enrolled_students),
+    )
+    metrics.instrument(
+        uni,
+        "check_student_schedule_conflicts",
+        lambda u, student_id: len(u.students[student_id].enrolled_courses),
+    )
+    metrics.instrument(
+        uni,
+        "find_free_slot",
+        lambda u, course_id, room_id: len(u.courses[course_id].enrolled_students),
+    )
+    metrics.instrument(uni, "build_timetable", lambda u, *args, **kw: len(u.courses))
@@ -3,11 +3,15 @@
 # codesignal_prescreen_sim/
 # ├── app_logic/
 # │   ├── base_app.py
-# │   └── app_impl.py
+# │   ├── app_impl.py
+# │   └── sharded_app.py
 # ├── test_level_1.py
 # ├── test_level_2.py
 # ├── test_level_3.py
 # ├── test_level_4.py
+# ├── test_message_log.py
+# ├── test_bulk_send.py
+# ├── test_sharded_app.py
 # └── README.md
 
 # =============================
@@ -41,42 +45,94 @@ class AppBase(ABC):
 # =============================
 # File: app_logic/app_impl.py
 # =============================
+from array import array
+from collections import OrderedDict
+import asyncio
+import bisect
+
 from app_logic.base_app import AppBase
 
 
+class MessageStore:
+    """all messages of an app in columns, a message id is its row number
+
+    Texts live once in a utf-8 buffer; recently sent texts are looked up
+    so fan-out and repeated messages share a single copy.
+    """
+
+    def __init__(self, intern_size: int = 4096):
+        self.senders = array("I")  # user id per message
+        self.receivers = array("I")
+        self.text_ids = array("I")
+        self.buffer = bytearray()  # all texts, utf-8
+        self.offsets = array("Q", [0])  # text i is buffer[offsets[i]:offsets[i + 1]]
+        self.recent = OrderedDict()  # LRU, key text, value text id
+        self.intern_size = intern_size
+
+    def __len__(self):
+        return len(self.text_ids)
+
+    def add_text(self, text: str) -> int:
+        tid = self.recent.get(text)
+        if tid is not None:
+            self.recent.move_to_end(text)
+            return tid
+        tid = len(self.offsets) - 1
+        self.buffer += text.encode()
+        self.offsets.append(len(self.buffer))
+        self.recent[text] = tid
+        if len(self.recent) > self.intern_size:
+            self.recent.popitem(last=False)
+        return tid
+
+    def add(self, sender_id: int, receiver_id: int, tid: int) -> int:
+        self.senders.append(sender_id)
+        self.receivers.append(receiver_id)
+        self.text_ids.append(tid)
+        return len(self.text_ids) - 1
+
+    def text(self, mid: int) -> str:
+        tid = self.text_ids[mid]
+        return self.buffer[self.offsets[tid] : self.offsets[tid + 1]].decode()
+
+
 class User:
-    def __init__(self, username: str):
+    __slots__ = ("username", "uid", "received", "sent", "wantstoblock", "wasblocked")
+
+    def __init__(self, username: str, uid: int):
         self.username = username
-        self.received = dict()  # key timestamp, value msg
-        self.sent = dict()  # key timestamp, value msg
-        self.wantstoblock = []
-        self.wasblocked = []
+        self.uid = uid  # row key in MessageStore
+        self.received = array("I")  # append-only message ids, increasing
+        self.sent = array("I")
+        self.wantstoblock = set()  # users this user blocked
+        self.wasblocked = set()  # users that blocked this user
 
 
 class AppImpl(AppBase):
     def __init__(self):
         # TODO: implement initialization of users, messages, and block list
-        self.users = []
+        self.users = dict()  # key username, value User
+        self.store = MessageStore()
+        self.next_uid = 0
 
     def create_user(self, username: str) -> bool:
         # TODO: implement
-        existantusername = next(
-            (u.username for u in self.users if u.username == username), None
-        )
-        if not existantusername:
-            self.users.append(User(username))
-            return True
-        return False
+        if username in self.users:
+            return False
+        self.users[username] = User(username, self.next_uid)
+        self.next_uid += 1
+        return True
 
     def delete_user(self, username: str) -> bool:
         # TODO: implement
-        target = next((u for u in self.users if u.username == username), None)
+        target = self.users.pop(username, None)
         if not target:
             return False
-        self.users.remove(target)
-        for user in self.users:
-            user.wasblocked = [b for b in user.wasblocked if b.username != username]
-            user.wantstoblock = [b for b in user.wantstoblock if b.username != username]
+        # only users on either side of a block with target refer to it
+        for user in target.wantstoblock:
+            user.wasblocked.discard(target)
+        for user in target.wasblocked:
+            user.wantstoblock.discard(target)
         # NOT GOOD TO DELETE WHILE ITERATING OF ITEM!
         # for user in self.users:
         #   if user.username == username:
@@ -89,15 +145,10 @@ class AppImpl(AppBase):
         #       user.wantstoblock.remove(blocked)
         return True
 
-    import datetime
-
-    def get_time_helper(self):
-        return datetime.datetime.now()
-
     def send_message(self, sender: str, receiver: str, message: str) -> bool:
         # TODO: implement
-        senderuser = next((u for u in self.users if u.username == sender), None)
-        receiveruser = next((u for u in self.users if u.username == receiver), None)
+        senderuser = self.users.get(sender)
+        receiveruser = self.users.get(receiver)
         if not senderuser or not receiveruser:
             return False
         if (
@@ -105,33 +156,362 @@ class AppImpl(AppBase):
             or receiveruser in senderuser.wantstoblock
         ):
             return False
-        time = self.get_time_helper()
-        senderuser.sent[time] = message
-        receiveruser.received[time] = message
+        # message ids order messages without a clock, ties are impossible
+        self._deliver(senderuser, receiveruser, self.store.add_text(message))
         return True
 
-    def get_messages(self, username: str) -> list[str]:
-        # TODO: implement
-        receiver = next((u for u in self.users if u.username == username), None)
+    def _deliver(self, senderuser: User, receiveruser: User, tid: int):
+        mid = self.store.add(senderuser.uid, receiveruser.uid, tid)
+        senderuser.sent.append(mid)
+        receiveruser.received.append(mid)
+
+    def send_many(self, sender: str, receivers: list[str], message: str) -> list[bool]:
+        """one message to every receiver, result per receiver like send_message"""
+        senderuser = self.users.get(sender)
+        if not senderuser:
+            return [False] * len(receivers)
+        accepted = []
+        results = []
+        for receiver in receivers:
+            receiveruser = self.users.get(receiver)
+            ok = bool(receiveruser) and not (
+                senderuser in receiveruser.wantstoblock
+                or receiveruser in senderuser.wantstoblock
+            )
+            if ok:
+                accepted.append(receiveruser)
+            results.append(ok)
+        # everything is checked before anything is stored
+        if accepted:
+            tid = self.store.add_text(message)
+            for receiveruser in accepted:
+                self._deliver(senderuser, receiveruser, tid)
+        return results
+
+    def send_batch(self, items: list[tuple[str, str, str]]) -> list[bool]:
+        """send_message for every (sender, receiver, message), in order"""
+        accepted = []
+        results = []
+        for sender, receiver, message in items:
+            senderuser = self.users.get(sender)
+            receiveruser = self.users.get(receiver)
+            ok = bool(senderuser and receiveruser) and not (
+                senderuser in receiveruser.wantstoblock
+                or receiveruser in senderuser.wantstoblock
+            )
+            if ok:
+                accepted.append((senderuser, receiveruser, message))
+            results.append(ok)
+        # every text is stored first, a bad one raises before any delivery
+        tids = [self.store.add_text(message) for _, _, message in accepted]
+        for (senderuser, receiveruser, _), tid in zip(accepted, tids):
+            self._deliver(senderuser, receiveruser, tid)
+        return results
+
+    def get_messages(
+        self, username: str, cursor: int | None = None, limit: int | None = None
+    ) -> list[str]:
+        """messages in the order received, after the message with id cursor"""
+        return [msg for _, msg in self.iter_messages(username, cursor, limit)]
+
+    def iter_messages(
+        self, username: str, cursor: int | None = None, limit: int | None = None
+    ):
+        """yields (id, msg), pass the last id seen as cursor to continue"""
+        receiver = self.users.get(username)
         if not receiver:
+            return
+        log = receiver.received
+        start = 0 if cursor is None else bisect.bisect_right(log, cursor)
+        end = len(log) if limit is None else min(len(log), start + limit)
+        for i in range(start, end):
+            yield log[i], self.store.text(log[i])
+
+    def get_latest_messages(self, username: str, limit: int = 50) -> list[str]:
+        """the last limit messages received, oldest first"""
+        receiver = self.users.get(username)
+        if not receiver or limit <= 0:
             return []
-        # sorted_timestamps = sorted(receiver.received, key=lambda t: list(receiver.received.keys()), reverse=False)
-        # sorted_msgs = []
-        # for t in sorted_timestamps:
-        #   sorted_msgs.append(receiver.received[t])
-        # return sorted_msgs
-        return [receiver.received[t] for t in sorted(receiver.received, reverse=False)]
+        return [self.store.text(mid) for mid in receiver.received[-limit:]]
 
     def block_user(self, blocker: str, blockee: str) -> bool:
         # TODO: implement
-        blocker_obj = next((u for u in self.users if u.username == blocker), None)
-        blockee_obj = next((u for u in self.users if u.username == blockee), None)
+        blocker_obj = self.users.get(blocker)
+        blockee_obj = self.users.get(blockee)
         if not blocker_obj or not blockee_obj:
             return False
-        if blocker_obj not in blockee_obj.wasblocked:
-            blockee_obj.wasblocked.append(blocker_obj)
-        if blockee_obj not in blocker_obj.wantstoblock:
-            blocker_obj.wantstoblock.append(blockee_obj)
+        blockee_obj.wasblocked.add(blocker_obj)
+        blocker_obj.wantstoblock.add(blockee_obj)
+        return True
+
+
+class AsyncApp:
+    """asyncio front-end that merges concurrent send_message calls
+
+    Calls arriving within window seconds of the first pending one are
+    sent together through AppImpl.send_batch.
+    """
+
+    def __init__(self, app: AppImpl, window: float = 0.001, max_batch: int = 1024):
+        self.app = app
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = []  # ((sender, receiver, message), future)
+        self.timer = None
+
+    async def send_message(self, sender: str, receiver: str, message: str) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append(((sender, receiver, message), future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        try:
+            results = self.app.send_batch([item for item, _ in pending])
+        except Exception:
+            # the batch stored nothing, one by one every caller gets its own result
+            for item, future in pending:
+                try:
+                    ok = self.app.send_message(*item)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(ok)
+            return
+        for (_, future), ok in zip(pending, results):
+            if not future.done():
+                future.set_result(ok)
+
+
+# =============================
+# File: app_logic/sharded_app.py
+# =============================
+from array import array
+from multiprocessing import Pipe, Process
+import zlib
+
+from app_logic.app_impl import MessageStore
+from app_logic.base_app import AppBase
+
+
+class ShardUser:
+    __slots__ = ("username", "gid", "received", "wantstoblock", "wasblocked")
+
+    def __init__(self, username: str, gid: int):
+        self.username = username
+        self.gid = gid  # unique across shards
+        self.received = array("I")  # message ids in the shard's MessageStore
+        self.wantstoblock = set()  # usernames, may live on other shards
+        self.wasblocked = set()
+
+
+class Shard:
+    """the users of one partition, blocks are kept by username on both sides"""
+
+    def __init__(self, number: int, count: int):
+        self.number = number
+        self.count = count
+        self.users = dict()  # key username, value ShardUser
+        self.store = MessageStore()
+        self.next_uid = 0
+
+    def exists(self, username: str) -> bool:
+        return username in self.users
+
+    def create_user(self, username: str) -> bool:
+        if username in self.users:
+            return False
+        gid = self.next_uid * self.count + self.number
+        self.users[username] = ShardUser(username, gid)
+        self.next_uid += 1
+        return True
+
+    def delete_user(self, username: str):
+        """returns the names this user blocked and was blocked by, or None"""
+        user = self.users.pop(username, None)
+        if not user:
+            return None
+        return user.wantstoblock, user.wasblocked
+
+    def add_block(self, username: str, other: str, outgoing: bool):
+        user = self.users[username]
+        (user.wantstoblock if outgoing else user.wasblocked).add(other)
+
+    def forget(self, usernames: list[str], deleted: str):
+        for username in usernames:
+            user = self.users.get(username)
+            if user:
+                user.wantstoblock.discard(deleted)
+                user.wasblocked.discard(deleted)
+
+    def check_senders(self, pairs: list[tuple[str, str]]) -> list[int | None]:
+        """sender gid per (sender, receiver) if the sender side allows it"""
+        gids = []
+        for sender, receiver in pairs:
+            user = self.users.get(sender)
+            if not user or receiver in user.wantstoblock or receiver in user.wasblocked:
+                gids.append(None)
+            else:
+                gids.append(user.gid)
+        return gids
+
+    def deliver(self, items: list[tuple[int, str, str]]) -> list[bool]:
+        results = []
+        for sender_gid, receiver, message in items:
+            user = self.users.get(receiver)
+            if user:
+                tid = self.store.add_text(message)
+                user.received.append(self.store.add(sender_gid, user.gid, tid))
+            results.append(bool(user))
+        return results
+
+    def get_messages(self, username: str) -> list[str]:
+        user = self.users.get(username)
+        if not user:
+            return []
+        return [self.store.text(mid) for mid in user.received]
+
+
+def serve_shard(conn, number: int, count: int):
+    shard = Shard(number, count)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            conn.send((True, getattr(shard, method)(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+class ShardedApp(AppBase):
+    """AppBase over worker processes, users partitioned by username hash
+
+    Every call is a round trip to the workers it touches; send_batch sends
+    to all shards before waiting, so batches run on all workers at once.
+    """
+
+    def __init__(self, workers: int = 4):
+        self.conns = []
+        self.processes = []
+        for number in range(workers):
+            conn, child = Pipe()
+            process = Process(
+                target=serve_shard, args=(child, number, workers), daemon=True
+            )
+            process.start()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def close(self):
+        for conn, process in zip(self.conns, self.processes):
+            conn.send(None)
+            process.join()
+        self.conns = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _shard(self, username: str) -> int:
+        return zlib.crc32(username.encode()) % len(self.conns)
+
+    def _call_all(self, requests: dict):
+        """requests: key shard, value (method, args); returns key shard, value result"""
+        for shard, request in requests.items():
+            self.conns[shard].send(request)
+        results = {}
+        error = None
+        for shard in requests:
+            # every reply is read, or the shard answers the next call with it
+            ok, result = self.conns[shard].recv()
+            if ok:
+                results[shard] = result
+            elif error is None:
+                error = result
+        if error is not None:
+            raise error
+        return results
+
+    def _call(self, username: str, method: str, *args):
+        shard = self._shard(username)
+        return self._call_all({shard: (method, (username,) + args)})[shard]
+
+    def create_user(self, username: str) -> bool:
+        return self._call(username, "create_user")
+
+    def delete_user(self, username: str) -> bool:
+        links = self._call(username, "delete_user")
+        if links is None:
+            return False
+        by_shard = {}
+        for other in links[0] | links[1]:
+            by_shard.setdefault(self._shard(other), []).append(other)
+        self._call_all(
+            {shard: ("forget", (names, username)) for shard, names in by_shard.items()}
+        )
+        return True
+
+    def send_message(self, sender: str, receiver: str, message: str) -> bool:
+        return self.send_batch([(sender, receiver, message)])[0]
+
+    def send_batch(self, items: list[tuple[str, str, str]]) -> list[bool]:
+        """send_message for every (sender, receiver, message), in order"""
+        checks = {}  # key shard, value item positions
+        for i, (sender, _, _) in enumerate(items):
+            checks.setdefault(self._shard(sender), []).append(i)
+        gids = self._call_all(
+            {
+                shard: ("check_senders", ([items[i][:2] for i in positions],))
+                for shard, positions in checks.items()
+            }
+        )
+        deliveries = {}  # key shard, value (position, (sender gid, receiver, message))
+        for shard, positions in checks.items():
+            for i, gid in zip(positions, gids[shard]):
+                if gid is not None:
+                    receiver = items[i][1]
+                    deliveries.setdefault(self._shard(receiver), []).append(
+                        (i, (gid, receiver, items[i][2]))
+                    )
+        for batch in deliveries.values():
+            batch.sort(key=lambda delivery: delivery[0])  # back into item order
+        delivered = self._call_all(
+            {
+                shard: ("deliver", ([item for _, item in batch],))
+                for shard, batch in deliveries.items()
+            }
+        )
+        results = [False] * len(items)
+        for shard, batch in deliveries.items():
+            for (i, _), ok in zip(batch, delivered[shard]):
+                results[i] = ok
+        return results
+
+    def get_messages(self, username: str) -> list[str]:
+        return self._call(username, "get_messages")
+
+    def block_user(self, blocker: str, blockee: str) -> bool:
+        if not self._call(blocker, "exists") or not self._call(blockee, "exists"):
+            return False
+        self._call(blocker, "add_block", blockee, True)
+        self._call(blockee, "add_block", blocker, False)
         return True
 
 
@@ -252,3 +632,178 @@ class TestLevel4(unittest.TestCase):
         self.assertTrue(self.app.block_user("alice", "bob"))
         self.assertFalse(self.app.send_message("bob", "alice", "Yo!"))
         self.assertFalse(self.app.send_message("alice", "bob", "Hey!"))
+
+
+# =============================
+# File: test_message_log.py
+# =============================
+import unittest
+from app_logic.app_impl import AppImpl
+
+
+class TestMessageLog(unittest.TestCase):
+    def setUp(self):
+        self.app = AppImpl()
+        self.app.create_user("alice")
+        self.app.create_user("bob")
+        for i in range(5):
+            self.app.send_message("alice", "bob", f"m{i}")
+
+    def test_cursor_continues_after_last_id(self):
+        first = list(self.app.iter_messages("bob", limit=2))
+        self.assertEqual([msg for _, msg in first], ["m0", "m1"])
+        cursor = first[-1][0]
+        self.assertEqual(self.app.get_messages("bob", cursor), ["m2", "m3", "m4"])
+        self.assertEqual(self.app.get_messages("bob", cursor, limit=2), ["m2", "m3"])
+
+    def test_limit(self):
+        self.assertEqual(self.app.get_messages("bob", limit=0), [])
+        self.assertEqual(len(self.app.get_messages("bob", limit=10)), 5)
+
+    def test_unknown_user(self):
+        self.assertEqual(self.app.get_messages("zed"), [])
+        self.assertEqual(list(self.app.iter_messages("zed")), [])
+        self.assertEqual(self.app.get_latest_messages("zed"), [])
+
+    def test_latest_messages(self):
+        self.assertEqual(self.app.get_latest_messages("bob", 2), ["m3", "m4"])
+        self.assertEqual(len(self.app.get_latest_messages("bob")), 5)
+        self.assertEqual(self.app.get_latest_messages("bob", 0), [])
+
+
+# =============================
+# File: test_bulk_send.py
+# =============================
+import asyncio
+import unittest
+from app_logic.app_impl import AppImpl, AsyncApp
+
+
+class TestBulkSend(unittest.TestCase):
+    def setUp(self):
+        self.app = AppImpl()
+        for name in ("alice", "bob", "carol"):
+            self.app.create_user(name)
+
+    def test_send_many(self):
+        self.app.block_user("carol", "alice")
+        results = self.app.send_many("alice", ["bob", "carol", "zed"], "Hi!")
+        self.assertEqual(results, [True, False, False])
+        self.assertEqual(self.app.get_messages("bob"), ["Hi!"])
+        self.assertEqual(self.app.get_messages("carol"), [])
+
+    def test_send_many_from_missing_user(self):
+        results = self.app.send_many("zed", ["bob", "carol"], "Hi!")
+        self.assertEqual(results, [False, False])
+
+    def test_send_batch_in_order(self):
+        items = [
+            ("alice", "bob", "1"),
+            ("carol", "bob", "2"),
+            ("zed", "bob", "lost"),
+            ("alice", "bob", "3"),
+        ]
+        self.assertEqual(self.app.send_batch(items), [True, True, False, True])
+        self.assertEqual(self.app.get_messages("bob"), ["1", "2", "3"])
+
+    def test_send_batch_is_atomic(self):
+        with self.assertRaises(Exception):
+            self.app.send_batch([("alice", "bob", "ok"), ("alice", "carol", None)])
+        self.assertEqual(self.app.get_messages("bob"), [])
+        self.assertEqual(self.app.get_messages("carol"), [])
+
+
+class TestAsyncApp(unittest.TestCase):
+    def setUp(self):
+        self.app = AppImpl()
+        for name in ("alice", "bob", "carol"):
+            self.app.create_user(name)
+        self.front = AsyncApp(self.app, window=0.01)
+
+    def send_all(self, items):
+        async def main():
+            sends = [self.front.send_message(*item) for item in items]
+            return await asyncio.gather(*sends, return_exceptions=True)
+
+        return asyncio.run(main())
+
+    def test_concurrent_sends_share_one_batch(self):
+        batches = []
+        send_batch = self.app.send_batch
+        self.app.send_batch = lambda items: batches.append(items) or send_batch(items)
+        results = self.send_all(
+            [("alice", "bob", "1"), ("carol", "bob", "2"), ("zed", "bob", "3")]
+        )
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(self.app.get_messages("bob"), ["1", "2"])
+
+    def test_bad_message_fails_only_its_caller(self):
+        results = self.send_all(
+            [("alice", "bob", "1"), ("alice", "carol", None), ("carol", "bob", "2")]
+        )
+        self.assertTrue(results[0])
+        self.assertIsInstance(results[1], Exception)
+        self.assertTrue(results[2])
+        self.assertEqual(self.app.get_messages("bob"), ["1", "2"])
+
+
+# =============================
+# File: test_sharded_app.py
+# =============================
+import unittest
+from unittest import mock
+
+import test_level_1
+import test_level_2
+import test_level_3
+import test_level_4
+from app_logic.sharded_app import ShardedApp
+
+
+def sharded(case, module):
+    """case with its app built as a two-worker ShardedApp instead of an AppImpl"""
+
+    class Sharded(case):
+        def setUp(self):
+            with mock.patch.object(module, "AppImpl", lambda: ShardedApp(workers=2)):
+                super().setUp()
+            self.addCleanup(self.app.close)
+
+    Sharded.__name__ = Sharded.__qualname__ = "Sharded" + case.__name__
+    return Sharded
+
+
+ShardedTestLevel1 = sharded(test_level_1.TestLevel1, test_level_1)
+ShardedTestLevel2 = sharded(test_level_2.TestLevel2, test_level_2)
+ShardedTestLevel3 = sharded(test_level_3.TestLevel3, test_level_3)
+ShardedTestLevel4 = sharded(test_level_4.TestLevel4, test_level_4)
+
+
+class TestShardedErrors(unittest.TestCase):
+    def setUp(self):
+        self.app = ShardedApp(workers=4)
+        self.addCleanup(self.app.close)
+        for name in ("alice", "bob", "carol", "dave", "erin", "frank"):
+            self.app.create_user(name)
+
+    def test_failed_batch_leaves_shards_in_sync(self):
+        items = [
+            ("alice", "bob", None),
+            ("carol", "dave", "hi"),
+            ("erin", "frank", "x"),
+        ]
+        with self.assertRaises(Exception):
+            self.app.send_batch(items)
+        # frank is on another shard than bob, his delivery went through
+        self.assertEqual(self.app.get_messages("frank"), ["x"])
+        self.assertTrue(self.app.create_user("zed"))
+        self.assertFalse(self.app.create_user("zed"))
+        self.assertTrue(self.app.send_message("alice", "zed", "hello"))
+        self.assertEqual(self.app.get_messages("zed"), ["hello"])
+
+    def test_batch_keeps_item_order_across_sender_shards(self):
+        # alice and erin live on different shards
+        items = [("alice", "bob", "1"), ("erin", "bob", "2"), ("alice", "bob", "3")]
+        self.assertEqual(self.app.send_batch(items), [True, True, True])
+        self.assertEqual(self.app.get_messages("bob"), ["1", "2", "3"])
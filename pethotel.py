@@ -1,19 +1,29 @@
+from itertools import count
+import heapq
+
+
 class Room:
+    __slots__ = ("id", "name", "species", "capacity", "pets")
+
     def __init__(self, id: str, name: str, capacity: int):
         self.id = id
         self.name = name
         self.species = None
         self.capacity = capacity
-        self.pets = []
+        self.pets = set()
 
 
 class Customer:
+    __slots__ = ("name", "id")
+
     def __init__(self, name: str, id: int):
         self.name = name
         self.id = id
 
 
 class Pet:
+    __slots__ = ("name", "species", "checked_in", "belongs_to", "assigned")
+
     def __init__(self, name: str, species: str, belongs_to: Customer):
         self.name = name
         self.species = species
@@ -27,6 +37,16 @@ class PetHotel:
         self.rooms = []
         self.customers = []
         self.pets = []
+        # lazy heaps, entries go stale when a room changes and are skipped
+        self.free_rooms = {}  # key species, value heap of (free beds, n, room)
+        self.empty_rooms = []  # heap of (capacity, n, room)
+        self.counter = count()  # tie-breaker, rooms don't compare
+        # occupancy, kept up to date so dashboards never scan
+        self.checked_in_pets = dict()  # in check-in order, value None
+        self.checked_in_by_species = dict()  # key species, value count
+        self.checked_in_by_customer = dict()  # key customer id, value count
+        self.free_beds = dict()  # key room id, value free beds
+        self.free_beds_total = 0
 
     def register_customer(self, customer: Customer):
         self.customers.append(customer)
@@ -36,6 +56,41 @@ class PetHotel:
 
     def add_room(self, room: Room):
         self.rooms.append(room)
+        self._index_room(room)
+
+    def _index_room(self, room: Room):
+        """called after every change of room.pets"""
+        free = room.capacity - len(room.pets)
+        self.free_beds_total += free - self.free_beds.get(room.id, 0)
+        self.free_beds[room.id] = free
+        if not room.pets:
+            room.species = None  # an empty room takes any species again
+            heapq.heappush(self.empty_rooms, (room.capacity, next(self.counter), room))
+        elif len(room.pets) < room.capacity:
+            heap = self.free_rooms.setdefault(room.species, [])
+            heapq.heappush(heap, (free, next(self.counter), room))
+
+    def _find_room(self, species: str):
+        """fullest room of species with a free bed, else the smallest empty one"""
+        heap = self.free_rooms.get(species, [])
+        while heap:
+            free, _, room = heap[0]
+            if room.species == species and room.capacity - len(room.pets) == free:
+                return room
+            heapq.heappop(heap)
+        while self.empty_rooms:
+            capacity, _, room = self.empty_rooms[0]
+            if not room.pets and capacity > 0:
+                return room
+            heapq.heappop(self.empty_rooms)
+        return None
+
+    def auto_assign(self, pet: Pet):
+        room = self._find_room(pet.species)
+        if room is None:
+            raise Exception(f"No room available for {pet.species}")
+        self.assign_pet_to_room(pet, room)
+        return room
 
     def assign_pet_to_room(self, pet: Pet, room: Room):
         if not pet.checked_in:
@@ -50,21 +105,81 @@ class PetHotel:
             raise Exception(
                 f"Pet species {pet.species} does not match room species {room.species}"
             )
-        room.pets.append(pet)
+        room.pets.add(pet)
         pet.assigned = room
+        self._index_room(room)
+
+    def _count(self, pet: Pet, step: int):
+        species = self.checked_in_by_species
+        species[pet.species] = species.get(pet.species, 0) + step
+        customers = self.checked_in_by_customer
+        customers[pet.belongs_to.id] = customers.get(pet.belongs_to.id, 0) + step
 
     def check_in(self, pet: Pet):
         if pet.checked_in:
             raise Exception("Pet is already checked in")
         pet.checked_in = True
+        self.checked_in_pets[pet] = None
+        self._count(pet, 1)
 
     def check_out(self, pet: Pet):
         if not pet.checked_in:
             raise Exception("Pet is not checked in")
         if pet.assigned:
-            pet.assigned.pets.remove(pet)
+            room = pet.assigned
+            room.pets.discard(pet)
             pet.assigned = None
+            self._index_room(room)
         pet.checked_in = False
+        del self.checked_in_pets[pet]
+        self._count(pet, -1)
+
+    def check_in_many(self, pets: list[Pet]):
+        """checks in and auto-assigns every pet, returns the rooms (None if full)
+
+        All pets are validated before any of them is checked in.
+        """
+        if len(set(pets)) != len(pets):
+            raise Exception("Pet is listed twice")
+        for pet in pets:
+            if pet.checked_in:
+                raise Exception(f"Pet {pet.name} is already checked in")
+        rooms = []
+        for pet in pets:
+            self.check_in(pet)
+            room = self._find_room(pet.species)
+            if room is not None:
+                self.assign_pet_to_room(pet, room)
+            rooms.append(room)
+        return rooms
+
+    def check_out_many(self, pets: list[Pet]):
+        """checks out every pet, all are validated before any is checked out"""
+        if len(set(pets)) != len(pets):
+            raise Exception("Pet is listed twice")
+        for pet in pets:
+            if not pet.checked_in:
+                raise Exception(f"Pet {pet.name} is not checked in")
+        for pet in pets:
+            self.check_out(pet)
+
+    def list_pets(
+        self,
+        species: str | None = None,
+        customer: Customer | None = None,
+        checked_in: bool | None = None,
+    ):
+        """yields (name, species, owner name), None means no filter
 
-    def list_pets(self):
-        return [(pet.name, pet.species, pet.belongs_to.name) for pet in self.pets]
+        Checked-in pets are copied when iteration starts, so the caller may
+        check pets in and out while iterating.
+        """
+        pets = list(self.checked_in_pets) if checked_in else self.pets
+        for pet in pets:
+            if checked_in is False and pet.checked_in:
+                continue
+            if species is not None and pet.species != species:
+                continue
+            if customer is not None and pet.belongs_to is not customer:
+                continue
+            yield (pet.name, pet.species, pet.belongs_to.name)
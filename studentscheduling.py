@@ -1,4 +1,94 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import multiprocessing
+import os
+import random
+import time
+
+# a week timetable is an int with bit day * SLOTS_PER_DAY + time_slot set
+DAYS = 7
+SLOTS_PER_DAY = 24
+
+
+def slot_bit(day: int, time_slot: int) -> int:
+    if not (0 <= day < DAYS and 0 <= time_slot < SLOTS_PER_DAY):
+        raise Exception("Timeslot out of range.")
+    return 1 << (day * SLOTS_PER_DAY + time_slot)
+
+
+def first_free_slot(busy: int):
+    """(day, time_slot) of the lowest clear bit, None if the week is full"""
+    free = ~busy & ((1 << DAYS * SLOTS_PER_DAY) - 1)
+    if not free:
+        return None
+    return divmod((free & -free).bit_length() - 1, SLOTS_PER_DAY)
+
+
+_stop = None  # set by any solver worker that places every course
+
+
+def _init_solver(stop):
+    global _stop
+    _stop = stop
+
+
+def _greedy_timetable(instance, rng):
+    """one randomized largest-degree-first colouring pass"""
+    sessions, sizes, neighbours, busy, fits, room_busy = instance
+    full = (1 << DAYS * SLOTS_PER_DAY) - 1
+    top = max(sizes) + 1
+    order = sorted(
+        range(len(sessions)),
+        key=lambda i: (len(neighbours[i]) + 1) * sessions[i] * (1 + rng.random())
+        + sizes[i] / top,
+        reverse=True,
+    )
+    room_busy = list(room_busy)
+    taken = [0] * len(sessions)
+    placed = [None] * len(sessions)
+    unplaced = 0
+    for i in order:
+        blocked = busy[i]
+        for j in neighbours[i]:
+            blocked |= taken[j]
+        for r in fits[i]:  # smallest room that holds the course first
+            free = ~(blocked | room_busy[r]) & full
+            if bin(free).count("1") >= sessions[i]:
+                break
+        else:
+            unplaced += 1
+            continue
+        bits = []
+        while free:
+            low = free & -free
+            bits.append(low)
+            free ^= low
+        mask = sum(rng.sample(bits, sessions[i]))
+        taken[i] = mask
+        room_busy[r] |= mask
+        placed[i] = (r, mask)
+    return unplaced, placed
+
+
+def _solve_timetable(instance, seed, deadline):
+    """restart the greedy pass until the deadline, keep the best result"""
+    rng = random.Random(seed)
+    best = None
+    while True:
+        result = _greedy_timetable(instance, rng)
+        if best is None or result[0] < best[0]:
+            best = result
+        if not best[0]:
+            if _stop is not None:
+                _stop.set()
+            return best
+        if time.time() >= deadline or (_stop is not None and _stop.is_set()):
+            return best
+
+
 class TimeSlot:
+    __slots__ = ("day", "start_time", "duration")
+
     def __init__(self, day: int, start_time: int, duration: int):
         self.day = day
         self.start_time = start_time
@@ -6,6 +96,17 @@ class TimeSlot:
 
 
 class Course:
+    __slots__ = (
+        "course_id",
+        "name",
+        "credits",
+        "max_students",
+        "enrolled_students",
+        "room",
+        "schedule",
+        "slots",
+    )
+
     def __init__(self, cid: str, name: str, credits: int, max_students: int):
         self.course_id = cid
         self.name = name
@@ -14,54 +115,79 @@ class Course:
         self.enrolled_students = []
         self.room = None
         self.schedule = []
+        self.slots = 0  # bitset of self.schedule
 
 
 class Classroom:
+    __slots__ = ("room_id", "capacity", "schedule", "slots")
+
     def __init__(self, room_id: str, capacity: int):
         self.room_id = room_id
         self.capacity = capacity
         self.schedule = dict()
+        self.slots = 0  # bitset of self.schedule keys
 
 
 class Student:
+    __slots__ = ("student_id", "name", "enrolled_courses", "credits", "slots")
+
     def __init__(self, sid: str, name: str):
         self.student_id = sid
         self.name = name
         self.enrolled_courses = []
+        self.credits = 0  # running total of enrolled_courses credits
+        self.slots = 0  # union of the enrolled courses' bitsets
 
 
 class University:
     def __init__(self):
-        self.students = []
-        self.courses = []
-        self.classrooms = []
+        self.students = dict()  # student_id -> Student
+        self.courses = dict()  # course_id -> Course
+        self.classrooms = dict()  # room_id -> Classroom
 
     def register_student(self, student: Student):
-        if student in self.students:
+        if student.student_id in self.students:
             raise Exception("Student already registered.")
-        self.students.append(student)
+        self.students[student.student_id] = student
 
     def add_course(self, course: Course):
-        if course in self.courses:
+        if course.course_id in self.courses:
             raise Exception("Course already added.")
-        self.courses.append(course)
+        self.courses[course.course_id] = course
+
+    def add_classroom(self, room: Classroom):
+        if room.room_id in self.classrooms:
+            raise Exception("Room already added.")
+        self.classrooms[room.room_id] = room
 
     def enroll_student_in_course(self, student_id: str, course_id: str):
-        student = next((s for s in self.students if s.student_id == student_id), None)
-        course = next((c for c in course if c.course_id == course_id), None)
+        student = self.students.get(student_id)
+        course = self.courses.get(course_id)
         if not student:
             raise Exception("Studnet must be registered first.")
         if not course:
             raise Exception("Course must be registered first.")
         if course.max_students <= len(course.enrolled_students):
             raise Exception("Max number of students in course reached.")
-        current_credits = sum(c.credits for c in student.enrolled_courses)
-        if current_credits + course.credits > 18:
+        if course in student.enrolled_courses:  # a handful of courses at most
+            raise Exception("Student already enrolled in course.")
+        if student.credits + course.credits > 18:
             raise Exception("Student has exceeded max number of credits.")
+        if student.slots & course.slots:
+            raise Exception("Course collides with the student's schedule.")
+        course.enrolled_students.append(student)
+        student.enrolled_courses.append(course)
+        student.credits += course.credits
+        student.slots |= course.slots
 
     def schedule_course(self, course_id: str, room_id: str, day: int, time_slot: int):
-        course = next((c for c in self.courses if c.course_id == course_id), None)
-        room = next((r for r in room if r.room_id == room_id), None)
+        """books room for course at (day, time_slot)
+
+        day is 0 to DAYS - 1 and time_slot 0 to SLOTS_PER_DAY - 1, an hour of
+        the week; anything else raises "Timeslot out of range.".
+        """
+        course = self.courses.get(course_id)
+        room = self.classrooms.get(room_id)
         if not course:
             raise Exception("Course is not registered.")
         if not room:
@@ -69,20 +195,101 @@ class University:
         if room.capacity < len(course.enrolled_students):
             raise Exception("Enrolled students exceed room capacity.")
         key = (day, time_slot)
-        if key in room.schedule:
+        bit = slot_bit(day, time_slot)
+        if room.slots & bit:
             raise Exception("Timeslot is already taken.")
+        if course.slots & bit:
+            raise Exception("Course is already scheduled at that time.")
         room.schedule[key] = course
-        course.room = course
+        room.slots |= bit
+        course.room = room
         course.schedule.append(key)
+        course.slots |= bit
+        for student in course.enrolled_students:
+            student.slots |= bit
 
     def check_student_schedule_conflicts(self, student_id: str) -> bool:
-        student = next((s for s in self.students if s.student_id == student_id), None)
+        student = self.students.get(student_id)
         if not student:
             raise Exception("Student not registered.")
-        slots = set()
+        slots = 0
         for course in student.enrolled_courses:
-            for slot in course.schedule:  # list of (day,time_slot)
-                if slot in slots:
-                    return False
-                slots.add(slot)
+            if slots & course.slots:
+                return False
+            slots |= course.slots
         return True
+
+    def find_free_slot(self, course_id: str, room_id: str):
+        """first (day, time_slot) free for the room and every enrolled student"""
+        course = self.courses.get(course_id)
+        room = self.classrooms.get(room_id)
+        if not course:
+            raise Exception("Course is not registered.")
+        if not room:
+            raise Exception("Room not existant.")
+        busy = room.slots
+        for student in course.enrolled_students:
+            busy |= student.slots
+        return first_free_slot(busy)
+
+    def build_timetable(self, constraints=None, time_budget=5.0, workers=None, seed=0):
+        """Room and slots for every course that has no room yet.
+
+        constraints maps course_id to weekly sessions (default 1). Restarts run
+        on a process pool for up to time_budget seconds; the best assignment is
+        booked via schedule_course. Returns the courses left unscheduled.
+        """
+        constraints = constraints or dict()
+        courses = [c for c in self.courses.values() if c.room is None]
+        if not courses:
+            return []
+        index = {c.course_id: i for i, c in enumerate(courses)}
+        rooms = sorted(self.classrooms.values(), key=lambda r: r.capacity)
+        sessions, sizes, neighbours, busy, fits = [], [], [], [], []
+        for course in courses:
+            size = len(course.enrolled_students)
+            linked = set()
+            blocked = 0
+            for student in course.enrolled_students:
+                blocked |= student.slots
+                for other in student.enrolled_courses:
+                    if other is not course and other.course_id in index:
+                        linked.add(index[other.course_id])
+            sessions.append(constraints.get(course.course_id, 1))
+            sizes.append(size)
+            neighbours.append(tuple(linked))
+            busy.append(blocked)
+            fits.append([r for r, room in enumerate(rooms) if room.capacity >= size])
+        instance = (sessions, sizes, neighbours, busy, fits, [r.slots for r in rooms])
+
+        workers = workers or os.cpu_count() or 1
+        deadline = time.time() + time_budget
+        if workers == 1:
+            results = [_solve_timetable(instance, seed, deadline)]
+        else:
+            stop = multiprocessing.Event()
+            with ProcessPoolExecutor(
+                workers, initializer=_init_solver, initargs=(stop,)
+            ) as pool:
+                results = list(
+                    pool.map(
+                        _solve_timetable,
+                        repeat(instance, workers),
+                        range(seed, seed + workers),
+                        repeat(deadline, workers),
+                    )
+                )
+        _, placed = min(results, key=lambda result: result[0])
+
+        unscheduled = []
+        for course, assignment in zip(courses, placed):
+            if assignment is None:
+                unscheduled.append(course)
+                continue
+            r, mask = assignment
+            while mask:
+                low = mask & -mask
+                mask ^= low
+                day, time_slot = divmod(low.bit_length() - 1, SLOTS_PER_DAY)
+                self.schedule_course(course.course_id, rooms[r].room_id, day, time_slot)
+        return unscheduled
@@ -0,0 +1,72 @@
+import random
+import unittest
+
+from confscheduling import (
+    ALREADY_GOING,
+    COLLIDING,
+    REGISTERED,
+    TALK_FULL,
+    Attendee,
+    Conference,
+    Talk,
+)
+
+
+class TestRegisterBatch(unittest.TestCase):
+    def setUp(self):
+        self.conf = Conference("conf")
+        self.alice = Attendee("alice")
+        self.bob = Attendee("bob")
+        self.keynote = Talk("keynote", 1, 0, 60)
+        self.workshop = Talk("workshop", 10, 30, 90)
+        self.lunch = Talk("lunch", 10, 60, 60)  # zero length
+
+    def test_statuses(self):
+        pairs = [
+            (self.alice, self.keynote),
+            (self.bob, self.keynote),
+            (self.alice, self.workshop),
+            (self.bob, self.workshop),
+            (self.alice, self.lunch),
+        ]
+        self.assertEqual(
+            self.conf.register_batch(pairs),
+            [REGISTERED, TALK_FULL, COLLIDING, REGISTERED, REGISTERED],
+        )
+        self.assertEqual(self.conf.get_schedule(self.alice), [(0, 60), (60, 60)])
+        self.assertEqual(self.keynote.attendees, {self.alice})
+
+    def test_duplicate_pairs(self):
+        pairs = [(self.alice, self.lunch), (self.alice, self.lunch)]
+        self.assertEqual(self.conf.register_batch(pairs), [REGISTERED, ALREADY_GOING])
+        self.assertEqual(self.alice.talks, [self.lunch])
+        with self.assertRaises(Exception):
+            self.conf.register_for_talk(self.alice, self.lunch)
+
+    def test_same_outcome_as_register_for_talk(self):
+        rng = random.Random(0)
+        talks = []
+        for i in range(30):
+            start = rng.randrange(0, 200)
+            end = start + rng.randint(0, 30)
+            talks.append((f"t{i}", rng.randint(0, 5), start, end))
+        pairs = [(rng.randrange(20), rng.randrange(30)) for _ in range(500)]
+        schedules = []
+        for batch in (False, True):
+            conf = Conference("conf")
+            attendees = [Attendee(f"a{i}") for i in range(20)]
+            conf_talks = [Talk(*talk) for talk in talks]
+            if batch:
+                conf.register_batch([(attendees[a], conf_talks[t]) for a, t in pairs])
+            else:
+                for a, t in pairs:
+                    try:
+                        conf.register_for_talk(attendees[a], conf_talks[t])
+                    except Exception:
+                        pass
+            schedules.append([attendee.schedule for attendee in attendees])
+        self.assertEqual(schedules[0], schedules[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
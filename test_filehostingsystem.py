@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from filehostingsystem import Directory, Server
+
+T0 = datetime(2024, 1, 1)
+SECOND = timedelta(seconds=1)
+
+
+def contents(server):
+    """every file as (path, size), and the saved state times"""
+    files = sorted(
+        ("/".join(path), f.size)
+        for paths in server.index.entries.values()
+        for path, f in paths.items()
+    )
+    return files, list(server.state_times)
+
+
+class TestJournalRecovery(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, "server.ckpt")
+        self.journal = os.path.join(directory.name, "server.journal")
+
+    def recover(self):
+        server = Server.recover("server", self.checkpoint, self.journal)
+        self.addCleanup(server.journal.close)
+        return server
+
+    def test_checkpoint_and_journal_tail(self):
+        server = self.recover()
+        server.root.add(Directory("docs"))
+        server.FILE_UPLOAD_AT(T0, "docs/a.txt", 10, None)
+        server.FILE_UPLOAD_AT(T0 + SECOND, "b.txt", 20, T0 + 100 * SECOND)
+        server.checkpoint(self.checkpoint)
+        server.FILE_COPY_AT(T0 + 2 * SECOND, "b.txt", "docs/c.txt")
+        server.DIR_QUOTA_AT(T0 + 3 * SECOND, "docs", 100)
+        server.FILE_COPY_MANY_AT(T0 + 4 * SECOND, [("docs/a.txt", "d.txt")])
+        server.journal.flush()
+        recovered = self.recover()
+        self.assertEqual(contents(recovered), contents(server))
+        self.assertEqual(recovered.DIR_USAGE_AT(T0 + 5 * SECOND, "docs"), (30, 2))
+        with self.assertRaises(RuntimeError):
+            recovered.FILE_UPLOAD_AT(T0 + 6 * SECOND, "docs/big", 71, None)
+
+    def test_torn_tail_is_cut_off(self):
+        server = self.recover()
+        server.FILE_UPLOAD_AT(T0, "x", 1, None)
+        server.journal.close()
+        with open(self.journal, "ab") as f:
+            f.write(b"\x01\x02\x03")
+        server = self.recover()
+        server.FILE_UPLOAD_AT(T0 + SECOND, "y", 2, None)
+        server.journal.close()
+        recovered = self.recover()
+        self.assertEqual(contents(recovered)[0], [("x", 1), ("y", 2)])
+
+    def test_failed_batch_changes_nothing(self):
+        server = self.recover()
+        server.FILE_UPLOAD_AT(T0, "x", 1, None)
+        before = contents(server)
+        with self.assertRaises(Exception):
+            server.FILE_COPY_MANY_AT(T0 + SECOND, [("x", "y"), ("missing", "z")])
+        self.assertEqual(contents(server), before)
+        server.FILE_COPY_MANY_AT(T0 + 2 * SECOND, [("x", "y"), ("y", "z")])
+        server.journal.flush()
+        self.assertEqual(contents(self.recover()), contents(server))
+
+
+if __name__ == "__main__":
+    unittest.main()
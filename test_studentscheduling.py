@@ -0,0 +1,30 @@
+import unittest
+
+from studentscheduling import Classroom, Course, Student, University
+
+
+class TestScheduleCourse(unittest.TestCase):
+    def setUp(self):
+        self.uni = University()
+        self.uni.add_course(Course("c1", "Algebra", 3, 30))
+        self.uni.add_classroom(Classroom("r1", 50))
+        self.uni.add_classroom(Classroom("r2", 50))
+        self.uni.register_student(Student("s1", "Ada"))
+        self.uni.enroll_student_in_course("s1", "c1")
+
+    def test_slot_out_of_range(self):
+        for day, time_slot in ((7, 0), (0, 24), (-1, 3)):
+            with self.assertRaises(Exception):
+                self.uni.schedule_course("c1", "r1", day, time_slot)
+
+    def test_course_twice_at_the_same_time(self):
+        self.uni.schedule_course("c1", "r1", 2, 10)
+        with self.assertRaises(Exception):
+            self.uni.schedule_course("c1", "r2", 2, 10)
+        self.uni.schedule_course("c1", "r2", 2, 11)
+        self.assertEqual(self.uni.courses["c1"].schedule, [(2, 10), (2, 11)])
+        self.assertTrue(self.uni.check_student_schedule_conflicts("s1"))
+
+
+if __name__ == "__main__":
+    unittest.main()